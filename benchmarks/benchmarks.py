@@ -0,0 +1,313 @@
+"""
+Benchmarks of the stages of the tracking pipeline on synthetic storm grids,
+see make_storm_grids in tint.testing.synthetic. They follow the conventions
+of airspeed velocity (asv), so results can be compared between commits with
+asv continuous or asv compare. run_benchmarks.py runs them without asv and
+reports throughput as well as time.
+
+The work method of each benchmark returns the amount of work done per call
+and its unit, from which run_benchmarks.py computes throughput. peakmem_
+methods measure peak memory of a call, and StagePeakMemory tracks the peak
+allocation of each stage of get_tracks, see MetricsTable in tint.helpers.
+
+Only what the stage benchmarks of extract, shift, pairs and props need is
+imported at module level, so the suite imports on commits older than the
+features it benchmarks. Other benchmarks import their features in setup and
+raise NotImplementedError, which asv reports as skipped, where they are
+missing.
+"""
+
+import contextlib
+import importlib.util
+import inspect
+import io
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from tint import Cell_tracks
+from tint.grid_utils import extract_grid_data, get_grid_size
+from tint.helpers import Record, Counter
+from tint.matching import get_pairs
+from tint.objects import init_current_objects, get_object_prop, write_tracks
+from tint.phase_correlation import get_global_shift
+
+try:
+    from tint.testing.synthetic import make_storm_grids, write_storm_files
+except ImportError:
+    # commits older than the synthetic grids use those of this checkout
+    spec = importlib.util.spec_from_file_location(
+        'synthetic', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  os.pardir, 'tint', 'testing',
+                                  'synthetic.py'))
+    synthetic = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(synthetic)
+    make_storm_grids = synthetic.make_storm_grids
+    write_storm_files = synthetic.write_storm_files
+
+NLEVELS = 10
+DOMAINS = [100, 200, 400, 800]
+CELLS = [10, 40, 160]
+CELL_DOMAIN = 400
+TRACK_LENGTHS = [10, 100, 1000]
+
+
+def require(module_name, *names):
+    """ Returns the objects names of the tint module module_name. Raises
+    NotImplementedError if the commit benchmarked does not have them. """
+    try:
+        module = importlib.import_module(module_name)
+        objects = [getattr(module, name) for name in names]
+    except (ImportError, AttributeError):
+        raise NotImplementedError(module_name + ' has no ' + ', '.join(names))
+    return objects[0] if len(objects) == 1 else objects
+
+
+def require_argument(function, name):
+    """ Raises NotImplementedError if function has no argument name. """
+    if name not in inspect.signature(function).parameters:
+        raise NotImplementedError(function.__qualname__ + ' has no ' + name)
+
+
+def get_grids(nscans, domain, ncells):
+    """ Returns synthetic grids on a square domain of domain pixels. """
+    return make_storm_grids(nscans, (NLEVELS, domain, domain), ncells)
+
+
+def get_scans(nscans, domain, ncells):
+    """ Returns grids, their raw slices and frames, and the tracking
+    parameters and record used to extract them. """
+    grids = get_grids(nscans, domain, ncells)
+    params = Cell_tracks().params
+    record = Record(grids[0])
+    grid_size = get_grid_size(grids[0])
+    raws, frames = zip(*[extract_grid_data(grid_obj, 'reflectivity',
+                                           grid_size, params)
+                         for grid_obj in grids])
+    return grids, raws, frames, params, record
+
+
+class ExtractGridData(object):
+    params = DOMAINS
+    param_names = ['domain']
+
+    def setup(self, domain):
+        self.grid = get_grids(1, domain, domain // 10)[0]
+        self.grid_size = get_grid_size(self.grid)
+        self.params = Cell_tracks().params
+
+    def time_extract_grid_data(self, domain):
+        extract_grid_data(self.grid, 'reflectivity', self.grid_size,
+                          self.params)
+
+    def peakmem_extract_grid_data(self, domain):
+        extract_grid_data(self.grid, 'reflectivity', self.grid_size,
+                          self.params)
+
+    def work(self, domain):
+        return NLEVELS * domain**2, 'voxels'
+
+
+class GlobalShift(object):
+    params = DOMAINS
+    param_names = ['domain']
+
+    def setup(self, domain):
+        _, self.raws, _, self.params, _ = get_scans(2, domain, domain // 10)
+
+    def time_get_global_shift(self, domain):
+        get_global_shift(self.raws[0], self.raws[1], self.params)
+
+    def peakmem_get_global_shift(self, domain):
+        get_global_shift(self.raws[0], self.raws[1], self.params)
+
+    def work(self, domain):
+        return domain**2, 'pixels'
+
+
+class GetPairs(object):
+    params = CELLS
+    param_names = ['ncells']
+
+    def setup(self, ncells):
+        grids, raws, frames, self.params, self.record = get_scans(
+            3, CELL_DOMAIN, ncells)
+        self.frames = frames
+        shift = get_global_shift(raws[0], raws[1], self.params)
+        self.record.update_scan_and_time(grids[0], grids[1])
+        pairs = get_pairs(frames[0], frames[1], shift, None, self.record,
+                          self.params)
+        self.current_objects, _ = init_current_objects(
+            frames[0], frames[1], pairs, Counter())
+        self.record.update_scan_and_time(grids[1], grids[2])
+        self.shift = get_global_shift(raws[1], raws[2], self.params)
+
+    def time_get_pairs(self, ncells):
+        get_pairs(self.frames[1], self.frames[2], self.shift,
+                  self.current_objects, self.record, self.params)
+
+    def work(self, ncells):
+        return int(np.max(self.frames[1])), 'objects'
+
+
+class GetPairsWorkers(GetPairs):
+    params = [1, 4, 16, 32]
+    param_names = ['workers']
+
+    def setup(self, workers):
+        require_argument(get_pairs, 'workers')
+        GetPairs.setup(self, CELLS[-1])
+
+    def time_get_pairs(self, workers):
+        get_pairs(self.frames[1], self.frames[2], self.shift,
+                  self.current_objects, self.record, self.params,
+                  workers=workers)
+
+    def work(self, workers):
+        return int(np.max(self.frames[1])), 'objects'
+
+
+class ObjectProp(object):
+    params = CELLS
+    param_names = ['ncells']
+
+    def setup(self, ncells):
+        grids, _, frames, self.params, self.record = get_scans(
+            1, CELL_DOMAIN, ncells)
+        self.grid = grids[0]
+        self.frame = frames[0]
+        self.record.update_scan_and_time(self.grid)
+
+    def time_get_object_prop(self, ncells):
+        get_object_prop(self.frame, self.grid, 'reflectivity', self.record,
+                        self.params)
+
+    def peakmem_get_object_prop(self, ncells):
+        get_object_prop(self.frame, self.grid, 'reflectivity', self.record,
+                        self.params)
+
+    def work(self, ncells):
+        return int(np.max(self.frame)), 'objects'
+
+
+class WriteTracks(object):
+    params = TRACK_LENGTHS
+    param_names = ['nscans']
+
+    def setup(self, nscans):
+        TracksBuffer = require('tint.helpers', 'TracksBuffer')
+        get_track_columns = require('tint.objects', 'get_track_columns')
+        grids, _, frames, params, self.record = get_scans(
+            1, CELL_DOMAIN, 40)
+        nobj = np.max(frames[0])
+        self.record.update_scan_and_time(grids[0])
+        self.current_objects, _ = init_current_objects(
+            frames[0], frames[0], np.arange(nobj) + 1, Counter())
+        self.obj_props = get_object_prop(frames[0], grids[0], 'reflectivity',
+                                         self.record, params)
+        self.columns = get_track_columns(self.record, self.current_objects,
+                                         self.obj_props)
+        # tracks of nscans earlier scans
+        self.tracks_buffer = TracksBuffer()
+        for _ in range(nscans):
+            self.tracks_buffer.append(self.columns)
+        self.tracks = self.tracks_buffer.to_frame()
+
+    def time_write_tracks(self, nscans):
+        with contextlib.redirect_stdout(io.StringIO()):
+            write_tracks(self.tracks, self.record, self.current_objects,
+                         self.obj_props)
+
+    def time_tracks_buffer_append(self, nscans):
+        self.tracks_buffer.append(self.columns)
+
+    def work(self, nscans):
+        return len(self.columns['scan']), 'rows'
+
+
+class GetTracks(object):
+    params = [DOMAINS[:3], CELLS[:2]]
+    param_names = ['domain', 'ncells']
+    number = 1
+    repeat = 3
+    timeout = 300
+
+    def setup(self, domain, ncells):
+        self.grids = get_grids(10, domain, ncells)
+
+    def time_get_tracks(self, domain, ncells):
+        with contextlib.redirect_stdout(io.StringIO()):
+            Cell_tracks().get_tracks(iter(self.grids))
+
+    def peakmem_get_tracks(self, domain, ncells):
+        with contextlib.redirect_stdout(io.StringIO()):
+            Cell_tracks().get_tracks(iter(self.grids))
+
+    def work(self, domain, ncells):
+        return len(self.grids), 'scans'
+
+
+class GetTracksFiles(object):
+    params = [1, 2, 4]
+    param_names = ['workers']
+    number = 1
+    repeat = 3
+    timeout = 300
+
+    def setup(self, workers):
+        self.read_grid = require('tint.grid_io', 'read_grid')
+        require_argument(Cell_tracks, 'preprocess_workers')
+        require_argument(Cell_tracks.get_tracks, 'reader')
+        self.path = tempfile.mkdtemp()
+        self.filenames = write_storm_files(
+            self.path, 20, (NLEVELS, CELL_DOMAIN, CELL_DOMAIN), CELLS[1])
+
+    def teardown(self, workers):
+        shutil.rmtree(self.path)
+
+    def time_get_tracks_files(self, workers):
+        tracks_obj = Cell_tracks(preprocess_workers=workers, verbose=False)
+        tracks_obj.get_tracks(self.filenames, reader=self.read_grid)
+
+    def work(self, workers):
+        return len(self.filenames), 'scans'
+
+
+class StagePeakMemory(object):
+    params = DOMAINS[:3]
+    param_names = ['domain']
+    timeout = 300
+
+    def setup(self, domain):
+        MetricsTable = require('tint.helpers', 'MetricsTable')
+        require_argument(MetricsTable, 'trace_memory')
+        tracks_obj = Cell_tracks(metrics=MetricsTable(trace_memory=True),
+                                 verbose=False)
+        tracks_obj.get_tracks(iter(get_grids(10, domain, domain // 10)))
+        self.metrics = tracks_obj.metrics.to_frame()
+
+    def get_peak(self, stage):
+        """ Returns largest peak allocation of stage over all scans. """
+        return int(self.metrics[stage + '_peak_bytes'].max())
+
+    def track_extract_peak_bytes(self, domain):
+        return self.get_peak('extract')
+    track_extract_peak_bytes.unit = 'bytes'
+
+    def track_shift_peak_bytes(self, domain):
+        return self.get_peak('shift')
+    track_shift_peak_bytes.unit = 'bytes'
+
+    def track_match_peak_bytes(self, domain):
+        return self.get_peak('match')
+    track_match_peak_bytes.unit = 'bytes'
+
+    def track_props_peak_bytes(self, domain):
+        return self.get_peak('props')
+    track_props_peak_bytes.unit = 'bytes'
+
+    def track_write_peak_bytes(self, domain):
+        return self.get_peak('write')
+    track_write_peak_bytes.unit = 'bytes'
@@ -0,0 +1,190 @@
+"""
+Runs the benchmarks in benchmarks.py without asv and reports time per call
+and throughput for every parameter, i.e. scaling curves of each stage, as
+well as peak memory. Unlike asv, which reports the peak resident size of the
+process, peakmem_ benchmarks report the peak traced by tracemalloc during a
+call, so that they do not depend on earlier benchmarks.
+
+    python benchmarks/run_benchmarks.py --output before.json
+    python benchmarks/run_benchmarks.py --output after.json
+    python benchmarks/run_benchmarks.py --compare before.json after.json
+
+"""
+
+import argparse
+import inspect
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import timeit
+import tracemalloc
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_param_sets(bench_class):
+    """ Returns list of parameter tuples of a benchmark class, following asv:
+    params is a list of values or, for several parameters, a list of lists.
+    """
+    params = getattr(bench_class, 'params', [])
+    if len(params) == 0:
+        return [()]
+    if not isinstance(params[0], (list, tuple)):
+        params = [params]
+    return list(itertools.product(*params))
+
+
+def time_call(method, args, repeat, min_time=0.1):
+    """ Returns median seconds per call of method(*args) over repeat runs of
+    enough calls to last at least min_time. """
+    timer = timeit.Timer(lambda: method(*args))
+    number = 1
+    while timer.timeit(number) < min_time and number < 1000:
+        number *= 10
+    return float(np.median(timer.repeat(repeat, number))) / number
+
+
+def peak_memory(method, args):
+    """ Returns peak bytes allocated by one call of method(*args). """
+    tracemalloc.start()
+    try:
+        method(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(bench, method_name, param_set, repeat):
+    """ Returns result of a benchmark method following asv prefixes: time_
+    methods are timed, peakmem_ methods report peak memory and track_
+    methods return the value reported. """
+    method = getattr(bench, method_name)
+    if method_name.startswith('time_'):
+        seconds = time_call(method, param_set,
+                            getattr(bench, 'repeat', repeat))
+        work, unit = bench.work(*param_set)
+        return {'seconds': seconds,
+                'throughput': work / seconds,
+                'unit': unit + '/s'}
+    if method_name.startswith('peakmem_'):
+        return {'value': peak_memory(method, param_set), 'unit': 'bytes'}
+    return {'value': method(*param_set), 'unit': getattr(method, 'unit', '')}
+
+
+def run(pattern=None, repeat=3):
+    """ Runs all benchmarks whose name contains pattern and returns list of
+    results. """
+    # benchmark the tint of this working tree, imported here so that
+    # comparing results does not need tint and its dependencies
+    sys.path[:0] = [BENCHMARK_DIR, os.path.dirname(BENCHMARK_DIR)]
+    import benchmarks
+    results = []
+    for class_name, bench_class in inspect.getmembers(benchmarks,
+                                                      inspect.isclass):
+        if bench_class.__module__ != benchmarks.__name__:
+            continue
+        methods = [name for name in dir(bench_class)
+                   if name.startswith(('time_', 'peakmem_', 'track_'))]
+        for param_set in get_param_sets(bench_class):
+            bench = bench_class()
+            try:
+                bench.setup(*param_set)
+            except NotImplementedError:
+                # skipped, as in asv, on commits without the feature
+                continue
+            for method_name in methods:
+                name = class_name + '.' + method_name
+                if pattern is not None and pattern not in name:
+                    continue
+                result = {'name': name,
+                          'params': dict(zip(bench.param_names, param_set))}
+                result.update(measure(bench, method_name, param_set, repeat))
+                results.append(result)
+                print_result(result)
+            if hasattr(bench, 'teardown'):
+                bench.teardown(*param_set)
+    return results
+
+
+def print_result(result):
+    params = ' '.join('%s=%s' % item for item in result['params'].items())
+    if 'seconds' in result:
+        print('%-45s %-22s %10.4f s %12.4g %s' % (
+            result['name'], params, result['seconds'], result['throughput'],
+            result['unit']))
+    else:
+        print('%-45s %-22s %12.4g %s' % (result['name'], params,
+                                         result['value'], result['unit']))
+    sys.stdout.flush()
+
+
+def get_value(result):
+    """ Returns the measurement of a result, lower is better. """
+    if 'seconds' in result:
+        return result['seconds']
+    return result['value']
+
+
+def get_commit():
+    """ Returns the git commit of the working tree, if any. """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=BENCHMARK_DIR).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(base_file, new_file, factor=1.1):
+    """ Prints the ratio of new to base time, or memory, of each benchmark
+    in both files, marking those worse or better by more than factor. """
+    with open(base_file) as f:
+        base = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    print('%s (%s) -> %s (%s)' % (base_file, base['commit'], new_file,
+                                  new['commit']))
+    base_values = dict(((result['name'], json.dumps(result['params'])),
+                        get_value(result)) for result in base['results'])
+    for result in new['results']:
+        key = (result['name'], json.dumps(result['params']))
+        if key not in base_values or base_values[key] == 0:
+            continue
+        ratio = get_value(result) / base_values[key]
+        if ratio > factor:
+            mark = 'worse'
+        elif ratio < 1 / factor:
+            mark = 'better'
+        else:
+            mark = ''
+        params = ' '.join('%s=%s' % item for item in result['params'].items())
+        print('%-45s %-22s %6.2fx %s' % (result['name'], params, ratio, mark))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--filter', help='run benchmarks containing FILTER')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write results to a json file')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'),
+                        help='compare two json result files')
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+    results = run(args.filter, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'commit': get_commit(),
+                       'machine': platform.node(),
+                       'python': platform.python_version(),
+                       'results': results}, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,7 @@ from glob import glob
 import os
 import pyart
 from tint.tracks import Cell_tracks
+from tint.grid_io import prefetch_grids
 from tint.visualization import animate
 
 # Obtain sorted list of pyart grid files
@@ -20,8 +21,10 @@ grid_files = glob(os.path.join(data_dir, '*.nc'))
 grid_files = [os.path.join(data_dir, file_name) for file_name in grid_files]
 grid_files.sort()
 
-# Create generator of pyart grid objects
-grid_gen = (pyart.io.read_grid(file_name) for file_name in grid_files)
+# Create iterator of pyart grid objects. Grids are read in the background
+# while the previous ones are tracked. A plain generator also works:
+# grid_gen = (pyart.io.read_grid(file_name) for file_name in grid_files)
+grid_gen = prefetch_grids(grid_files, size=2, reader=pyart.io.read_grid)
 
 # Instantiate tracks object and view parameter defaults
 tracks_obj = Cell_tracks()
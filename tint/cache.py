@@ -0,0 +1,235 @@
+"""
+tint.cache
+==========
+
+On-disk cache of the products of grid files, for tracking the same files
+again with other matching parameters.
+
+"""
+
+import glob
+import gzip
+import hashlib
+import json
+import os
+import pickle
+from collections import OrderedDict
+
+from .helpers import preprocess_grid, get_checkpoint_products
+from .helpers import restore_products, start_stage, end_stage
+
+# tracking parameters the products of a scan depend on, see preprocess_scan
+CACHE_PARAMS = ['FIELD_THRESH', 'MIN_SIZE', 'GS_ALT', 'ISO_THRESH',
+                'ISO_SMOOTH']
+
+
+class ScanCache(object):
+    """
+    ScanCache objects keep the products of grid files that do not depend on
+    matching: the labeled frame, the raw slice at GS_ALT and the object
+    properties, see get_checkpoint_products in tint.helpers. Entries are
+    keyed by the content of the file, the field and the parameters in
+    CACHE_PARAMS, so tracking the same files with other SEARCH_MARGIN,
+    MAX_DISPARITY or MAX_SHIFT_DISP reads no grids. When the entries exceed
+    max_bytes, the least recently used are removed. Entries are listed once,
+    when the cache is opened, and their sizes and order of use are then
+    kept in memory; entries added by other processes sharing path are
+    counted once they are used or the cache is opened again.
+
+    Attributes
+    ----------
+    path : str
+        Directory holding one compressed pickle per entry, and an index of
+        the content hashes of the files seen and of the file of each entry.
+        The index is written by write_index.
+    max_bytes : int
+        Maximum total size of the entries on disk.
+    reader : function
+        Reads a grid from a file name on a cache miss. Default is
+        pyart.io.read_grid.
+    hits : int
+        Number of scans read from the cache.
+    misses : int
+        Number of scans read from their file and added to the cache.
+
+    """
+
+    def __init__(self, path, max_bytes=10**9, reader=None):
+        if reader is None:
+            import pyart
+            reader = pyart.io.read_grid
+        self.path = path
+        self.max_bytes = max_bytes
+        self.reader = reader
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.__index_path = os.path.join(path, 'index.json')
+        self.__hashes = {}
+        self.__entry_hashes = {}
+        self.__index_changed = False
+        # size of each entry, least recently used first
+        self.__entry_sizes = OrderedDict()
+        self.__nbytes = 0
+        entries = []
+        for entry_path in glob.glob(os.path.join(path, '*.pkl.gz')):
+            stat = os.stat(entry_path)
+            key = os.path.basename(entry_path)[:-len('.pkl.gz')]
+            entries.append((stat.st_mtime, key, stat.st_size))
+        for _, key, size in sorted(entries):
+            self.__entry_sizes[key] = size
+            self.__nbytes += size
+        if os.path.exists(self.__index_path):
+            with open(self.__index_path) as f:
+                index = json.load(f)
+            # indexes of other versions are rebuilt
+            self.__hashes = index.get('files', {})
+            self.__entry_hashes = index.get('entries', {})
+
+    def get_file_hash(self, filename):
+        """ Returns sha1 hash of the content of a file. Hashes are kept in
+        the index by path, size and modification time, so unchanged files
+        are only read once. """
+        filename = os.path.abspath(filename)
+        stat = os.stat(filename)
+        version = [stat.st_size, stat.st_mtime_ns]
+        if filename in self.__hashes:
+            file_version, file_hash = self.__hashes[filename]
+            if file_version == version:
+                return file_hash
+        sha1 = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(2**20), b''):
+                sha1.update(block)
+        self.__hashes[filename] = [version, sha1.hexdigest()]
+        self.__index_changed = True
+        return sha1.hexdigest()
+
+    def write_index(self):
+        """ Writes the index if it changed since it was last written. It is
+        replaced in one step, so it is never seen partially written. Called
+        by iter_scans once all scans are read; call it after get_scan. """
+        if not self.__index_changed:
+            return
+        tmp_path = '%s.%d.tmp' % (self.__index_path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump({'files': self.__hashes,
+                       'entries': self.__entry_hashes}, f)
+        os.replace(tmp_path, self.__index_path)
+        self.__index_changed = False
+
+    def get_key(self, filename, field, params):
+        """ Returns the key of the products of field in a file. """
+        key_params = [field] + [params[name] for name in CACHE_PARAMS]
+        key = self.get_file_hash(filename) + json.dumps(key_params)
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def __entry_path(self, key):
+        return os.path.join(self.path, key + '.pkl.gz')
+
+    def get(self, key):
+        """ Returns the products stored under key, or None. """
+        entry_path = self.__entry_path(key)
+        try:
+            with gzip.open(entry_path, 'rb') as f:
+                entry = pickle.load(f)
+        except (IOError, OSError):
+            return None
+        # the modification time orders entries by last use when the cache
+        # is opened again
+        os.utime(entry_path, None)
+        if key in self.__entry_sizes:
+            self.__entry_sizes.move_to_end(key)
+        else:
+            # put by another process sharing the cache
+            self.__entry_sizes[key] = os.path.getsize(entry_path)
+            self.__nbytes += self.__entry_sizes[key]
+        return entry
+
+    def put(self, key, entry, file_hash=None):
+        """ Stores products under key, of the file with content hash
+        file_hash if given, and evicts old entries if the cache is full. """
+        entry_path = self.__entry_path(key)
+        # processes sharing the cache may put the same entry
+        tmp_path = '%s.%d.tmp' % (entry_path, os.getpid())
+        with gzip.open(tmp_path, 'wb', compresslevel=1) as f:
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, entry_path)
+        self.__nbytes += size - self.__entry_sizes.pop(key, 0)
+        self.__entry_sizes[key] = size
+        if file_hash is not None:
+            self.__entry_hashes[key] = file_hash
+            self.__index_changed = True
+        self.evict()
+
+    def evict(self):
+        """ Removes least recently used entries until the entries fit in
+        max_bytes. Files of which no entry is left are removed from the
+        index. """
+        evicted = False
+        while self.__nbytes > self.max_bytes and self.__entry_sizes:
+            key, size = self.__entry_sizes.popitem(last=False)
+            try:
+                os.remove(self.__entry_path(key))
+            except OSError:
+                # already removed by another process sharing the cache
+                pass
+            self.__nbytes -= size
+            self.__entry_hashes.pop(key, None)
+            evicted = True
+        if evicted:
+            file_hashes = set(self.__entry_hashes.values())
+            self.__hashes = dict(
+                (filename, version) for filename, version
+                in self.__hashes.items() if version[1] in file_hashes)
+            self.__index_changed = True
+
+    def get_scan(self, filename, field, params, fft_engine=None):
+        """ Returns products of field in a file, like get_scan_products in
+        tint.helpers but without the grid, with its grid size and radar
+        location. The file is only read if it is not in the cache. """
+        return self.get_scans(filename, field, [params], fft_engine)[0]
+
+    def get_scans(self, filename, field, param_sets, fft_engine=None):
+        """ Returns list of the products of field in a file for each
+        dictionary of parameters in param_sets, see get_scan. The file is
+        read at most once. """
+        scans = []
+        grid_obj = None
+        for params in param_sets:
+            start = start_stage()
+            key = self.get_key(filename, field, params)
+            entry = self.get(key)
+            if entry is None:
+                if grid_obj is None:
+                    grid_obj = self.reader(filename)
+                scan = preprocess_grid(grid_obj, field, params, fft_engine)
+                entry = get_checkpoint_products(scan)
+                entry['grid_size'] = scan['grid_size']
+                entry['radar_info'] = scan['radar_info']
+                self.put(key, entry, self.get_file_hash(filename))
+                self.misses += 1
+                scans.append(scan)
+                continue
+            self.hits += 1
+            if key not in self.__entry_hashes:
+                # entry put before the index was last written
+                self.__entry_hashes[key] = self.get_file_hash(filename)
+                self.__index_changed = True
+            scan = restore_products(entry, fft_engine)
+            scan['seconds'] = {}
+            scan['peak_bytes'] = {}
+            end_stage(start, 'extract', scan['seconds'], scan['peak_bytes'])
+            scans.append(scan)
+        return scans
+
+    def iter_scans(self, filenames, field, params, fft_engine=None):
+        """ Yields products of each file in filenames, in order, and then
+        writes the index. See get_scan. """
+        try:
+            for filename in filenames:
+                yield self.get_scan(filename, field, params, fft_engine)
+        finally:
+            self.write_index()
@@ -0,0 +1,131 @@
+"""
+tint.chunks
+===========
+
+Offline tracking of long grid sequences in parallel chunks of time.
+
+"""
+
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .helpers import MetricsTable, get_checkpoint_products
+from .tracks import Cell_tracks
+
+
+def track_chunk(grids, offset, start, reader=None, tracker_kwargs=None):
+    """ Tracks a chunk of grids, given from scan offset of the full sequence
+    on. The scans before start overlap the previous chunk and only warm up
+    the tracking state; their tracks are discarded by Cell_tracks.stitch.
+    Returns dictionary of the tracker, the products of scan start, the
+    correction and candidate tallies before it, and the objects and interval
+    of the link to it, from which stitch checks that the warm up reached the
+    state of a single run. """
+    if tracker_kwargs is None:
+        tracker_kwargs = {}
+    if tracker_kwargs.get('metrics') is not None:
+        # each chunk collects its own metrics, merged by stitch, which calls
+        # the hooks in the calling process
+        tracker_kwargs = dict(tracker_kwargs, metrics=MetricsTable(
+            trace_memory=tracker_kwargs['metrics'].trace_memory))
+    if reader is not None:
+        grids = (reader(grid) for grid in grids)
+    grids = iter(grids)
+    tracks_obj = Cell_tracks(**tracker_kwargs)
+    tracks_obj.get_tracks(itertools.islice(grids, start - offset + 1))
+    first_scan = get_checkpoint_products(tracks_obj.last_scan)
+    tally = dict(tracks_obj.record.correction_tally)
+    candidates = tracks_obj.record.candidate_tally
+    # current_objects is replaced, not modified, by the tracking loop
+    current_objects = tracks_obj.current_objects
+    interval = tracks_obj.record.interval
+    tracks_obj.get_tracks(grids)
+    return {'tracks_obj': tracks_obj,
+            'offset': offset,
+            'start': start,
+            'first_scan': first_scan,
+            'tally': tally,
+            'candidates': candidates,
+            'current_objects': current_objects,
+            'interval': interval}
+
+
+def get_chunk_bounds(nscans, nchunks, overlap):
+    """ Returns list of (offset, start, end) scan indices of each chunk. Scans
+    start to end are tracked by the chunk, after warming up from offset. """
+    nchunks = max(1, min(nchunks, nscans))
+    edges = np.linspace(0, nscans, nchunks + 1).astype(int)
+    return [(max(0, edges[i] - overlap), edges[i], edges[i + 1])
+            for i in range(nchunks)]
+
+
+def track_chunks(grids, nchunks=None, workers=None, overlap=3, reader=None,
+                 tracker_kwargs=None):
+    """ Tracks a time-sorted list of grids, or file names read with reader,
+    split into nchunks chunks tracked in parallel by workers processes, then
+    stitched in order with Cell_tracks.stitch. Each chunk warms up on the
+    overlap scans before it. Shift correction depends on the last heads of
+    each cell, which the first warm up link does not have, so a warm up does
+    not always reach the state of a single run at the start of the chunk.
+    stitch checks this, and a chunk whose state differs is tracked again in
+    this process from the end of the previous chunk. Tracks are therefore
+    always those of a single run; a longer overlap makes the fallback rarer
+    at the cost of more warm up. Returns a Cell_tracks object holding the
+    tracks of all scans, which can be updated like any other. """
+    if workers is None:
+        workers = 1
+    if nchunks is None:
+        nchunks = workers
+    bounds = get_chunk_bounds(len(grids), nchunks, overlap)
+    if tracker_kwargs is None:
+        tracker_kwargs = {}
+    chunk_kwargs = tracker_kwargs
+    if tracker_kwargs.get('metrics') is not None:
+        # metrics hooks stay in this process, see get_first_tracker
+        chunk_kwargs = dict(tracker_kwargs, metrics=MetricsTable(
+            trace_memory=tracker_kwargs['metrics'].trace_memory))
+    args = [(grids[offset:end], offset, start, reader, chunk_kwargs)
+            for offset, start, end in bounds]
+
+    if workers <= 1:
+        chunks = (track_chunk(*chunk_args) for chunk_args in args)
+        tracks_obj = get_first_tracker(next(chunks), tracker_kwargs)
+        for chunk, (_, start, end) in zip(chunks, bounds[1:]):
+            stitch_chunk(tracks_obj, chunk, grids[start + 1:end], reader)
+        return tracks_obj
+
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(track_chunk, *chunk_args)
+                   for chunk_args in args]
+        tracks_obj = get_first_tracker(futures[0].result(), tracker_kwargs)
+        for future, (_, start, end) in zip(futures[1:], bounds[1:]):
+            stitch_chunk(tracks_obj, future.result(), grids[start + 1:end],
+                         reader)
+    return tracks_obj
+
+
+def get_first_tracker(chunk, tracker_kwargs=None):
+    """ Returns the tracker of the first chunk, which the later chunks are
+    stitched to, with the metrics hooks of tracker_kwargs called with its
+    rows and attached. """
+    tracks_obj = chunk['tracks_obj']
+    if tracker_kwargs is None or tracker_kwargs.get('metrics') is None:
+        return tracks_obj
+    metrics = MetricsTable(tracker_kwargs['metrics'].hooks,
+                           tracker_kwargs['metrics'].trace_memory)
+    metrics.add_rows(tracks_obj.metrics.get_columns())
+    tracks_obj.metrics = metrics
+    return tracks_obj
+
+
+def stitch_chunk(tracks_obj, chunk, grids, reader=None):
+    """ Stitches chunk to tracks_obj. If the state of the chunk at its first
+    scan differs from that of tracks_obj, the grids after the first scan are
+    tracked again by tracks_obj instead. """
+    if tracks_obj.stitch(chunk):
+        return
+    if reader is not None:
+        grids = (reader(grid) for grid in grids)
+    tracks_obj.get_tracks(iter(grids))
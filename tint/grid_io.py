@@ -0,0 +1,237 @@
+"""
+tint.grid_io
+============
+
+Tools for reading grids for the tracking loop: reading ahead of it, and
+reading only what tracking uses from pyart grid files.
+
+"""
+
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import netCDF4
+import numpy as np
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# variables read besides the field, as in pyart grids
+GRID_VARIABLES = ['time', 'x', 'y', 'z', 'origin_latitude',
+                  'origin_longitude', 'radar_latitude', 'radar_longitude']
+
+
+class GridPrefetcher(object):
+    """
+    GridPrefetcher objects wrap an iterable of grids and read the next grids
+    in the background while the current one is being tracked. They are
+    iterators, so they can be passed to Cell_tracks.get_tracks or animate in
+    place of a grid generator.
+
+    Attributes
+    ----------
+    size : int
+        Maximum number of grids read ahead of the consumer.
+    reader : function
+        If given, the wrapped iterable yields file names and reader is applied
+        to each of them, e.g. pyart.io.read_grid.
+    processes : bool
+        If True, reader is run in a pool of size worker processes. Otherwise
+        the wrapped iterable is consumed by a single background thread.
+
+    """
+
+    def __init__(self, grids, size=2, reader=None, processes=False):
+        if processes and reader is None:
+            raise ValueError('a reader is required to prefetch in processes')
+        self.size = size
+        self.reader = reader
+        self.processes = processes
+        self.__items = iter(grids)
+        self.__stop = threading.Event()
+        if processes:
+            self.__pool = ProcessPoolExecutor(size)
+            self.__futures = deque()
+            self.__fill_futures()
+        else:
+            self.__queue = queue.Queue(maxsize=size)
+            self.__thread = threading.Thread(target=self.__fill_queue)
+            self.__thread.daemon = True
+            self.__thread.start()
+
+    def __fill_queue(self):
+        """ Reads grids into the queue. Blocks while the queue is full. """
+        try:
+            for item in self.__items:
+                if self.reader is not None:
+                    item = self.reader(item)
+                if not self.__put((item, None)):
+                    return
+        except Exception as error:
+            self.__put((None, error))
+            return
+        self.__put((None, StopIteration()))
+
+    def __put(self, entry):
+        """ Puts entry in the queue unless the prefetcher is closed. """
+        while not self.__stop.is_set():
+            try:
+                self.__queue.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __fill_futures(self):
+        """ Submits reads until size reads are pending. """
+        while len(self.__futures) < self.size:
+            try:
+                file_name = next(self.__items)
+            except StopIteration:
+                return
+            self.__futures.append(self.__pool.submit(self.reader, file_name))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.processes:
+            if not self.__futures:
+                self.close()
+                raise StopIteration
+            grid = self.__futures.popleft().result()
+            self.__fill_futures()
+            return grid
+        if self.__stop.is_set():
+            raise StopIteration
+        grid, error = self.__queue.get()
+        if error is not None:
+            self.close()
+            raise error
+        return grid
+
+    next = __next__
+
+    def close(self):
+        """ Stops reading ahead and releases the background workers. """
+        self.__stop.set()
+        if self.processes:
+            for future in self.__futures:
+                future.cancel()
+            self.__futures.clear()
+            self.__pool.shutdown(wait=False)
+
+
+def prefetch_grids(grids, size=2, reader=None, processes=False):
+    """ Returns a GridPrefetcher reading up to size grids ahead. For example,
+    prefetch_grids(grid_files, reader=pyart.io.read_grid) overlaps reading of
+    the next grids with tracking of the current one. """
+    return GridPrefetcher(grids, size, reader, processes)
+
+
+class TrackingGrid(object):
+    """
+    TrackingGrid objects hold the parts of a pyart grid file used by
+    tracking: coordinates, time, projection, radar location and a single
+    field, which is read when first accessed. They have the attributes of
+    pyart grids that get_grid_size, parse_grid_datetime, get_radar_info,
+    extract_grid_data and get_object_prop use, so they can be tracked in
+    place of pyart grids. They cannot be animated, which needs pyart grids.
+
+    Attributes
+    ----------
+    filename : str
+        Path of the grid file.
+    field : str
+        Name of the field read.
+    time, x, y, z : dict
+        Time and coordinates, with their data and attributes as in pyart
+        grids.
+    origin_latitude, origin_longitude : dict
+        Origin of the grid projection.
+    radar_latitude, radar_longitude : dict
+        Location of the radar, None if not in the file.
+    projection : dict
+        Projection parameters. See get_projparams.
+    fields : dict
+        Dictionary holding field, read from the file on first access. See
+        read_field.
+
+    """
+
+    def __init__(self, filename, field='reflectivity'):
+        self.filename = filename
+        self.field = field
+        self.__fields = None
+        with netCDF4.Dataset(filename) as dset:
+            for name in GRID_VARIABLES:
+                if name in dset.variables:
+                    setattr(self, name, read_variable(dset.variables[name]))
+                else:
+                    setattr(self, name, None)
+            self.projection = read_attributes(dset.variables['projection'])
+        if '_include_lon_0_lat_0' in self.projection:
+            include = self.projection['_include_lon_0_lat_0']
+            self.projection['_include_lon_0_lat_0'] = include == 'true'
+
+    @property
+    def fields(self):
+        """ Fields dictionary, holding only field. """
+        if self.__fields is None:
+            with netCDF4.Dataset(self.filename) as dset:
+                self.__fields = {
+                    self.field: read_field(dset.variables[self.field])}
+        return self.__fields
+
+    def get_projparams(self):
+        """ Returns projection parameters like pyart grids. """
+        projparams = self.projection.copy()
+        if projparams.pop('_include_lon_0_lat_0', False):
+            projparams['lon_0'] = self.origin_longitude['data'][0]
+            projparams['lat_0'] = self.origin_latitude['data'][0]
+        return projparams
+
+
+def read_attributes(ncvar):
+    """ Returns dictionary of the attributes of a variable, leaving out those
+    of packing, which is undone when the data is read. """
+    return dict((name, ncvar.getncattr(name)) for name in ncvar.ncattrs()
+                if name not in ('scale_factor', 'add_offset'))
+
+
+def read_variable(ncvar):
+    """ Returns dictionary of a variable with its data, as in pyart. """
+    variable = read_attributes(ncvar)
+    variable['data'] = np.atleast_1d(ncvar[:])
+    return variable
+
+
+def read_field(ncvar):
+    """ Returns dictionary of a field of shape (1, nz, ny, nx) in the file,
+    with data of shape (nz, ny, nx). Tracking only uses the values of the
+    data, where extract_grid_data sets fill values to 0, so the mask is not
+    computed unless the field is packed or has missing values, which pyart
+    masks too. """
+    field_dict = read_attributes(ncvar)
+    ncattrs = ncvar.ncattrs()
+    if ('scale_factor' in ncattrs or 'add_offset' in ncattrs
+            or 'missing_value' in ncattrs):
+        field_dict['data'] = ncvar[0]
+        return field_dict
+    if '_FillValue' in ncattrs:
+        fill_value = ncvar.getncattr('_FillValue')
+    else:
+        fill_value = netCDF4.default_fillvals[ncvar.dtype.str[1:]]
+    ncvar.set_auto_mask(False)
+    field_dict['data'] = np.ma.MaskedArray(ncvar[0], fill_value=fill_value)
+    return field_dict
+
+
+def read_grid(filename, field='reflectivity'):
+    """ Returns TrackingGrid of field from a grid file written by pyart.
+    This is a faster reader than pyart.io.read_grid for tracking, e.g. as
+    reader of prefetch_grids, GridIngestor or TrackingScheduler. """
+    return TrackingGrid(filename, field)
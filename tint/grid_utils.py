@@ -10,7 +10,6 @@ Tools for pulling data from pyart grids.
 import datetime
 
 import numpy as np
-import pandas as pd
 from scipy import ndimage
 
 
@@ -63,16 +62,15 @@ def get_filtered_frame(grid, min_size, thresh):
 
 
 def clear_small_echoes(label_image, min_size):
-    """ Takes in binary image and clears objects less than min_size. """
-    flat_image = pd.Series(label_image.flatten())
-    flat_image = flat_image[flat_image > 0]
-    size_table = flat_image.value_counts(sort=False)
-    small_objects = size_table.keys()[size_table < min_size]
-
-    for obj in small_objects:
-        label_image[label_image == obj] = 0
-    label_image = ndimage.label(label_image)
-    return label_image[0]
+    """ Takes in labeled image and clears objects less than min_size. The
+    remaining objects are relabeled consecutively through a lookup table, which
+    keeps the order in which ndimage.label numbered them. """
+    sizes = np.bincount(label_image.ravel())
+    keep = sizes >= min_size
+    keep[0] = False
+    relabel = np.zeros(len(sizes), dtype=label_image.dtype)
+    relabel[keep] = np.arange(np.count_nonzero(keep)) + 1
+    return relabel[label_image]
 
 
 def extract_grid_data(grid_obj, field, grid_size, params):
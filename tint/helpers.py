@@ -5,11 +5,18 @@ tint.helpers
 """
 
 import string
+import time
+import tracemalloc
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
 
-from .grid_utils import parse_grid_datetime, get_grid_size
+from .grid_utils import parse_grid_datetime, get_grid_size, extract_grid_data
+from .grid_utils import get_radar_info
+from .objects import get_object_table, get_object_prop
+from .phase_correlation import get_spectrum
 
 
 class Counter(object):
@@ -24,6 +31,9 @@ class Counter(object):
         Last uid assigned.
     cid : dict
         Record of cell genealogy.
+    __cid_changes : dict
+        Values of the cid entries changed since the last snapshot, None for
+        entries that were added. See snapshot.
 
     """
 
@@ -33,6 +43,7 @@ class Counter(object):
         have split off from another cell. """
         self.uid = -1
         self.cid = {}
+        self.__cid_changes = None
 
     def next_uid(self, count=1):
         """ Incremented for every new independently formed cell. """
@@ -42,6 +53,9 @@ class Counter(object):
 
     def next_cid(self, pid):
         """ Returns parent uid with appended letter to denote child. """
+        if (self.__cid_changes is not None
+                and pid not in self.__cid_changes):
+            self.__cid_changes[pid] = self.cid.get(pid)
         if pid in self.cid.keys():
             self.cid[pid] += 1
         else:
@@ -49,6 +63,43 @@ class Counter(object):
         letter = string.ascii_lowercase[self.cid[pid]]
         return pid + letter
 
+    def snapshot(self):
+        """ Returns snapshot of the counter, see restore. Rather than copying
+        cid, the entries changed after the snapshot are journaled, so the cost
+        does not grow with the number of cells. Only the most recent snapshot
+        can be restored. """
+        self.__cid_changes = {}
+        return {'uid': self.uid, 'cid_changes': self.__cid_changes}
+
+    def restore(self, snapshot):
+        """ Reverts the counter to the state of snapshot. """
+        self.uid = snapshot['uid']
+        for pid, count in snapshot['cid_changes'].items():
+            if count is None:
+                del self.cid[pid]
+            else:
+                self.cid[pid] = count
+        self.__cid_changes = None
+
+
+SHIFT_DTYPE = np.dtype([('scan', 'i8'),
+                        ('uid', 'O'),
+                        ('corrected', 'f8', (2,)),
+                        ('global', 'f8', (2,)),
+                        ('last_heads', 'f8', (2,)),
+                        ('phase', 'f8', (2,)),
+                        ('case', 'i1')])
+
+
+def grow_rows(rows, size):
+    """ Returns structured array with room for at least size rows, keeping
+    the contents of rows. Capacity is doubled to amortize the copies. """
+    if len(rows) >= size:
+        return rows
+    grown = np.empty(max(size, 2 * len(rows), 16), dtype=rows.dtype)
+    grown[:len(rows)] = rows
+    return grown
+
 
 class Record(object):
     """
@@ -66,13 +117,26 @@ class Record(object):
     interval_ratio : float
         Ratio of current interval to previous interval.
     grid_size : array of floats
-        Length 3 array containing z, y, and x mesh size in meters.
+        Length 3 array containing z, y, and x mesh size in meters. Computed
+        from grid_obj unless given.
+    shift_log : str
+        Level of shift correction bookkeeping. 'off' records nothing, 'tally'
+        only updates correction_tally and candidate_tally, 'full' also records
+        every shift.
+    shift_rows : structured array
+        Records inputs of shift correction process, see SHIFT_DTYPE and
+        matching.correct_shift. Only the first nshifts rows are in use. Last
+        heads of new objects are NaN.
+    new_shift_rows : structured array
+        Rows of new shifts to be added to shift_rows. Only the first
+        nnew_shifts rows are in use.
     shifts : dataframe
-        Records inputs of shift correction process. See matching.correct_shift.
-    new_shfits : dataframe
-        Row of new shifts to be added to shifts dataframe.
+        Shift records as a dataframe, built from shift_rows when read.
     correction_tally : dict
         Tallies correction cases for performance analysis.
+    candidate_tally : int
+        Number of candidate matches found, i.e. objects of the next scan in
+        the search box of an object with disparity below MAX_DISPARITY.
 
 
     Shift Correction Case Guide:
@@ -85,62 +149,448 @@ class Record(object):
 
     """
 
-    def __init__(self, grid_obj):
+    def __init__(self, grid_obj, shift_log='full', grid_size=None):
+        if shift_log not in ('off', 'tally', 'full'):
+            raise ValueError('shift_log must be off, tally or full')
+        if grid_size is None:
+            grid_size = get_grid_size(grid_obj)
         self.scan = -1
         self.time = None
         self.interval = None
         self.interval_ratio = None
-        self.grid_size = get_grid_size(grid_obj)
-        self.shifts = pd.DataFrame()
-        self.new_shifts = pd.DataFrame()
+        self.grid_size = grid_size
+        self.shift_log = shift_log
+        self.shift_rows = np.empty(0, dtype=SHIFT_DTYPE)
+        self.nshifts = 0
+        self.new_shift_rows = np.empty(0, dtype=SHIFT_DTYPE)
+        self.nnew_shifts = 0
         self.correction_tally = {'case0': 0, 'case1': 0, 'case2': 0,
                                  'case3': 0, 'case4': 0, 'case5': 0}
+        self.candidate_tally = 0
+
+    @property
+    def shifts(self):
+        """ Shift records indexed by scan and uid. """
+        if self.nshifts == 0:
+            return pd.DataFrame()
+        rows = self.shift_rows[:self.nshifts]
+        shifts = pd.DataFrame({'scan': rows['scan'],
+                               'uid': rows['uid'],
+                               'corrected': list(rows['corrected']),
+                               'global': list(rows['global']),
+                               'last_heads': list(rows['last_heads']),
+                               'phase': list(rows['phase']),
+                               'case': rows['case']})
+        shifts.set_index(['scan', 'uid'], inplace=True)
+        return shifts
 
     def count_case(self, case_num):
         """ Updates correction_tally dictionary. This is used to monitor the
         shift correction process. """
-        self.correction_tally['case' + str(case_num)] += 1
+        if self.shift_log != 'off':
+            self.correction_tally['case' + str(case_num)] += 1
+
+    def count_candidates(self, count):
+        """ Updates candidate_tally. """
+        if self.shift_log != 'off':
+            self.candidate_tally += count
 
     def record_shift(self, corr, gl_shift, l_heads, local_shift, case):
         """ Records corrected shift, phase shift, global shift, and last
         heads per object per timestep. This information can be used to
         monitor and refine the shift correction algorithm in the
         correct_shift function. """
+        if self.shift_log != 'full':
+            return
         if l_heads is None:
-            l_heads = np.ma.array([-999, -999], mask=[True, True])
+            l_heads = [np.nan, np.nan]
 
-        new_shift_record = pd.DataFrame()
-        new_shift_record['scan'] = [self.scan]
-        new_shift_record['uid'] = ['uid']
-        new_shift_record['corrected'] = [corr]
-        new_shift_record['global'] = [gl_shift]
-        new_shift_record['last_heads'] = [l_heads]
-        new_shift_record['phase'] = [local_shift]
-        new_shift_record['case'] = [case]
-
-        self.new_shifts = self.new_shifts.append(new_shift_record)
+        self.new_shift_rows = grow_rows(self.new_shift_rows,
+                                        self.nnew_shifts + 1)
+        self.new_shift_rows[self.nnew_shifts] = (
+            self.scan, 'uid', corr, gl_shift, np.ma.filled(l_heads, np.nan),
+            local_shift, case
+        )
+        self.nnew_shifts += 1
 
     def add_uids(self, current_objects):
         """ Because of the chronology of the get_tracks process, object uids
         cannot be added to the shift record at the time of correction, so they
         must be added later in the process. """
-        if len(self.new_shifts) > 0:
-            self.new_shifts['uid'] = current_objects['uid']
-            self.new_shifts.set_index(['scan', 'uid'], inplace=True)
-            self.shifts = self.shifts.append(self.new_shifts)
-            self.new_shifts = pd.DataFrame()
+        if self.nnew_shifts > 0:
+            nshifts = self.nshifts + self.nnew_shifts
+            new_shifts = self.new_shift_rows[:self.nnew_shifts]
+            new_shifts['uid'] = current_objects['uid']
+            self.shift_rows = grow_rows(self.shift_rows, nshifts)
+            self.shift_rows[self.nshifts:nshifts] = new_shifts
+            self.nshifts = nshifts
+            self.nnew_shifts = 0
+
+    def snapshot(self):
+        """ Returns snapshot of the record, see restore. Recorded shift rows
+        are never modified, so only their number is saved and the cost does
+        not grow with the length of the record. """
+        new_shift_rows = self.new_shift_rows[:self.nnew_shifts]
+        return {'scan': self.scan,
+                'time': self.time,
+                'interval': self.interval,
+                'interval_ratio': self.interval_ratio,
+                'nshifts': self.nshifts,
+                'new_shift_rows': new_shift_rows.copy(),
+                'correction_tally': dict(self.correction_tally),
+                'candidate_tally': self.candidate_tally}
+
+    def restore(self, snapshot):
+        """ Reverts the record to the state of snapshot. """
+        self.scan = snapshot['scan']
+        self.time = snapshot['time']
+        self.interval = snapshot['interval']
+        self.interval_ratio = snapshot['interval_ratio']
+        self.nshifts = snapshot['nshifts']
+        self.nnew_shifts = len(snapshot['new_shift_rows'])
+        self.new_shift_rows = grow_rows(self.new_shift_rows, self.nnew_shifts)
+        self.new_shift_rows[:self.nnew_shifts] = snapshot['new_shift_rows']
+        self.correction_tally = dict(snapshot['correction_tally'])
+        self.candidate_tally = snapshot['candidate_tally']
 
     def update_scan_and_time(self, grid_obj1, grid_obj2=None):
         """ Updates the scan number and associated time. This information is
         used for obtaining object properties as well as for the interval ratio
         correction of last_heads vectors. """
+        time2 = None
+        if grid_obj2 is not None:
+            time2 = parse_grid_datetime(grid_obj2)
+        self.update_scan(parse_grid_datetime(grid_obj1), time2)
+
+    def update_scan(self, time1, time2=None):
+        """ Same as update_scan_and_time, given the times of the scans rather
+        than their grids. """
         self.scan += 1
-        self.time = parse_grid_datetime(grid_obj1)
-        if grid_obj2 is None:
+        self.time = time1
+        if time2 is None:
             # tracks for last scan are being written
             return
-        time2 = parse_grid_datetime(grid_obj2)
         old_diff = self.interval
         self.interval = time2 - self.time
         if old_diff is not None:
             self.interval_ratio = self.interval.seconds/old_diff.seconds
+
+
+class TracksBuffer(object):
+    """
+    TracksBuffer objects accumulate the rows of the tracks table in growable
+    numpy arrays, one per column, so that writing a scan does not copy the
+    rows of all previous scans. The DataFrame is only built by to_frame.
+
+    Attributes
+    ----------
+    columns : dict
+        Arrays holding the rows of each column. Only the first nrows entries
+        are in use; the rest is spare capacity.
+    nrows : int
+        Number of rows written.
+
+    """
+
+    def __init__(self):
+        self.columns = {}
+        self.nrows = 0
+
+    def append(self, new_columns):
+        """ Appends rows given as a dictionary of equal length columns. """
+        nnew = len(new_columns['scan'])
+        if nnew == 0:
+            return
+        for name, values in new_columns.items():
+            values = np.asarray(values)
+            if values.dtype.kind == 'U':
+                values = values.astype(object)
+            column = self.columns.get(name)
+            if column is None:
+                column = np.empty(max(16, nnew), dtype=values.dtype)
+            elif (len(column) < self.nrows + nnew
+                  or column.dtype != np.result_type(column, values)):
+                capacity = max(2 * len(column), self.nrows + nnew)
+                grown = np.empty(capacity, np.result_type(column, values))
+                grown[:self.nrows] = column[:self.nrows]
+                column = grown
+            column[self.nrows:self.nrows + nnew] = values
+            self.columns[name] = column
+        self.nrows += nnew
+
+    def get_columns(self):
+        """ Returns dictionary of the columns trimmed to the rows in use. """
+        return dict((name, column[:self.nrows])
+                    for name, column in self.columns.items())
+
+    def drop_scans(self, first_scan):
+        """ Drops rows of first_scan and all later scans. Scans are written in
+        order, so this only moves the end of the buffer. """
+        if self.nrows > 0:
+            scans = self.columns['scan'][:self.nrows]
+            self.nrows = int(np.searchsorted(scans, first_scan))
+
+    def rollback(self):
+        """ Discards output written after this buffer was saved in a
+        checkpoint. Rows held in memory are restored with the buffer itself,
+        so there is nothing to discard here. """
+        pass
+
+    def to_frame(self):
+        """ Returns tracks DataFrame indexed by scan and uid. """
+        if self.nrows == 0:
+            return pd.DataFrame()
+        tracks = pd.DataFrame(self.get_columns())
+        tracks.set_index(['scan', 'uid'], inplace=True)
+        return tracks
+
+
+class MetricsTable(TracksBuffer):
+    """
+    MetricsTable objects collect one row of instrumentation per scan tracked
+    by Cell_tracks: wall time in seconds of each stage, and counts of objects,
+    matches, candidate matches and correction cases. Rows are stored like
+    tracks rows, see TracksBuffer, and overwritten in the same way when the
+    last scan is linked up with new scans.
+
+    Attributes
+    ----------
+    hooks : list
+        Functions called with each row dictionary as it is added, e.g. to
+        forward metrics to a monitoring system. Rows of a scan are added
+        again when the scan is overwritten. Hooks are never pickled:
+        checkpoints are saved without them, and TrackingScheduler and
+        track_chunks call them in the calling process, so they may be
+        lambdas, closures or client objects.
+    trace_memory : bool
+        If True, Cell_tracks traces allocations with tracemalloc while it
+        tracks, and rows also hold the peak bytes allocated by each stage
+        above the memory in use when it started. If tracemalloc is already
+        tracing, its peak is left alone and stage peaks are only exact for
+        stages that raise it, see end_stage. Stages run in worker
+        processes are not traced and report 0. Tracing slows tracking
+        down several times, so use it for profiling only.
+
+    """
+
+    def __init__(self, hooks=None, trace_memory=False):
+        TracksBuffer.__init__(self)
+        if hooks is None:
+            hooks = []
+        self.hooks = hooks
+        self.trace_memory = trace_memory
+
+    def add(self, row):
+        """ Adds the row of one scan and calls the hooks with it. """
+        for hook in self.hooks:
+            hook(row)
+        self.append(dict((name, [value]) for name, value in row.items()))
+
+    def add_rows(self, columns):
+        """ Adds rows given as a dictionary of columns, such as those of a
+        MetricsTable without hooks in a worker process, and calls the hooks
+        with each. """
+        for index in range(len(columns.get('scan', []))):
+            self.add(dict((name, column[index])
+                          for name, column in columns.items()))
+
+    def to_frame(self):
+        """ Returns metrics DataFrame indexed by scan. """
+        if self.nrows == 0:
+            return pd.DataFrame()
+        return pd.DataFrame(self.get_columns()).set_index('scan')
+
+
+# True while tracemalloc was started by start_tracing
+_owns_tracing = False
+
+
+def start_tracing():
+    """ Starts tracemalloc for the stage measurements of start_stage, unless
+    it is already tracing. Returns True if tracing was started. Only the peak
+    of tracing started here is reset between stages, so measurements of the
+    caller around tracking are left alone. """
+    global _owns_tracing
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start()
+    _owns_tracing = True
+    return True
+
+
+def stop_tracing():
+    """ Stops tracing started by start_tracing. """
+    global _owns_tracing
+    tracemalloc.stop()
+    _owns_tracing = False
+
+
+def start_stage():
+    """ Returns the start of a pipeline stage measured by end_stage. If
+    tracemalloc was started by start_tracing, its peak is reset, so that
+    end_stage reads the peak of the stage alone. Tracing started elsewhere
+    is not reset, see end_stage. """
+    if not tracemalloc.is_tracing():
+        return time.perf_counter(), None, None
+    if _owns_tracing:
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        else:
+            # before python 3.9 the peak is only reset by restarting
+            tracemalloc.stop()
+            tracemalloc.start()
+    memory, peak = tracemalloc.get_traced_memory()
+    return time.perf_counter(), memory, peak
+
+
+def end_stage(start, stage, seconds, peak_bytes):
+    """ Stores the wall time of a stage started with start_stage in
+    seconds and, if traced, its peak allocation in peak_bytes. If the peak
+    was not reset by start_stage, it is only that of the stage if the stage
+    raised it. Otherwise the stage allocated at most the earlier peak and
+    the memory it left allocated is stored instead. """
+    start_time, start_memory, start_peak = start
+    seconds[stage] = time.perf_counter() - start_time
+    if start_memory is None or not tracemalloc.is_tracing():
+        return
+    memory, peak = tracemalloc.get_traced_memory()
+    if peak > start_peak or _owns_tracing:
+        peak_bytes[stage] = peak - start_memory
+    else:
+        peak_bytes[stage] = max(memory - start_memory, 0)
+
+
+def get_scan_products(grid_obj, field, grid_size, params, fft_engine=None):
+    """ Returns dictionary of the products derived from one scan: its time,
+    the raw slice at GS_ALT and its spectrum, the labeled frame and its object
+    table.
+    In get_tracks the products of frame2 are handed to the next iteration as
+    those of frame1, so each scan is processed only once. Wall time of each
+    stage is kept in seconds and, if traced, its peak allocation in
+    peak_bytes. See start_stage. """
+    start = start_stage()
+    raw, frame = extract_grid_data(grid_obj, field, grid_size, params)
+    obj_table = get_object_table(frame)
+    spectrum = get_spectrum(raw, fft_engine)
+    scan = {'grid': grid_obj,
+            'time': parse_grid_datetime(grid_obj),
+            'raw': raw,
+            'spectrum': spectrum,
+            'frame': frame,
+            'obj_table': obj_table,
+            'nobj': obj_table['nobj'],
+            'obj_props': None,
+            'seconds': {},
+            'peak_bytes': {}}
+    end_stage(start, 'extract', scan['seconds'], scan['peak_bytes'])
+    return scan
+
+
+def preprocess_scan(grid_obj, field, grid_size, params, fft_engine=None):
+    """ Returns products of one scan together with its object properties, but
+    without the grid. This runs in worker processes, so only the derived
+    products are sent back to the tracking process. """
+    scan = get_scan_products(grid_obj, field, grid_size, params, fft_engine)
+    if scan['nobj'] > 0:
+        start = start_stage()
+        scan['obj_props'] = get_object_prop(scan['frame'], grid_obj, field,
+                                            Record(grid_obj), params,
+                                            scan['obj_table'])
+        end_stage(start, 'props', scan['seconds'], scan['peak_bytes'])
+    scan['grid'] = None
+    return scan
+
+
+def preprocess_grid(grid_obj, field, params, fft_engine=None):
+    """ Returns products of one grid like preprocess_scan, together with the
+    grid size and radar location of the grid. """
+    grid_size = get_grid_size(grid_obj)
+    scan = preprocess_scan(grid_obj, field, grid_size, params, fft_engine)
+    scan['grid_size'] = grid_size
+    scan['radar_info'] = get_radar_info(grid_obj)
+    return scan
+
+
+def read_scan_products(filename, reader, field, params, fft_engine=None):
+    """ Returns products of one grid file read with reader, see
+    preprocess_grid. In worker processes this reads and preprocesses a scan
+    without sending its grid between processes. """
+    return preprocess_grid(reader(filename), field, params, fft_engine)
+
+
+def iter_scan_products(grids, field, grid_size, params, fft_engine=None,
+                       workers=None, reader=None):
+    """ Yields products of each grid in grids, in order. If reader is given,
+    grids are file names read with reader, and products also hold the grid
+    size and radar location of their grid, see read_scan_products. If workers
+    is greater than 1, scans are preprocessed in a pool of worker processes up
+    to 2*workers scans ahead of the consumer, so that extraction and object
+    properties of upcoming scans overlap with matching of the current one.
+    Workers given file names read them themselves and send back only the
+    products; grid objects are sent to the workers and kept in the
+    products. """
+    if workers is None or workers <= 1:
+        for grid_obj in grids:
+            if reader is None:
+                yield get_scan_products(grid_obj, field, grid_size, params,
+                                        fft_engine)
+                continue
+            grid_obj = reader(grid_obj)
+            scan_grid_size = get_grid_size(grid_obj)
+            scan = get_scan_products(grid_obj, field, scan_grid_size, params,
+                                     fft_engine)
+            yield dict(scan, grid_size=scan_grid_size,
+                       radar_info=get_radar_info(grid_obj))
+        return
+
+    pending = deque()
+    with ProcessPoolExecutor(workers) as pool:
+        for grid_obj in grids:
+            if reader is None:
+                future = pool.submit(preprocess_scan, grid_obj, field,
+                                     grid_size, params, fft_engine)
+            else:
+                future = pool.submit(read_scan_products, grid_obj, reader,
+                                     field, params, fft_engine)
+                grid_obj = None
+            pending.append((grid_obj, future))
+            if len(pending) > 2*workers:
+                grid_done, future = pending.popleft()
+                yield dict(future.result(), grid=grid_done)
+        while pending:
+            grid_done, future = pending.popleft()
+            yield dict(future.result(), grid=grid_done)
+
+
+def get_empty_products(scan):
+    """ Returns products of an empty scan following the given scan. Used as
+    frame2 when the final scan of a sequence is written. """
+    frame = np.zeros_like(scan['frame'])
+    empty = {'grid': None,
+             'time': None,
+             'raw': None,
+             'spectrum': None,
+             'frame': frame,
+             'obj_table': get_object_table(frame),
+             'nobj': 0,
+             'obj_props': None,
+             'seconds': {},
+             'peak_bytes': {}}
+    return empty
+
+
+def get_checkpoint_products(scan):
+    """ Returns the products of scan that are stored in a checkpoint: its
+    time, raw slice, frame, object properties and stage measurements. The
+    grid is not stored, and the spectrum and object table are recomputed by
+    restore_products. """
+    return dict((key, scan[key]) for key in ('time', 'raw', 'frame', 'nobj',
+                                             'obj_props', 'seconds',
+                                             'peak_bytes'))
+
+
+def restore_products(scan, fft_engine=None):
+    """ Returns full products of a scan read from a checkpoint. """
+    return dict(scan, grid=None,
+                spectrum=get_spectrum(scan['raw'], fft_engine),
+                obj_table=get_object_table(scan['frame']))
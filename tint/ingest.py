@@ -0,0 +1,194 @@
+"""
+tint.ingest
+===========
+
+Asynchronous ingestion of grid files arriving over time, e.g. from a live
+radar feed.
+
+"""
+
+import asyncio
+import glob
+import heapq
+import itertools
+import os
+from collections import deque
+
+from .grid_utils import parse_grid_datetime
+
+
+class DirectoryWatcher(object):
+    """
+    DirectoryWatcher objects are asynchronous iterators over the paths of
+    files appearing in a directory, in order of discovery. Files already in
+    the directory are yielded first, sorted by name. Writers should move
+    finished files into the directory, so that partially written files never
+    match pattern.
+
+    Attributes
+    ----------
+    path : str
+        Directory being watched.
+    pattern : str
+        Glob pattern of the file names to yield.
+    poll_interval : float
+        Seconds between listings of the directory.
+    idle_timeout : float
+        Iteration stops after no new files were found for this many seconds.
+        If None, the directory is watched until the task is cancelled.
+    seen : set
+        Paths already yielded.
+
+    """
+
+    def __init__(self, path, pattern='*.nc', poll_interval=1.0,
+                 idle_timeout=None):
+        self.path = path
+        self.pattern = pattern
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.seen = set()
+        self.__pending = deque()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        idle = 0
+        while True:
+            if not self.__pending:
+                paths = glob.glob(os.path.join(self.path, self.pattern))
+                new_paths = sorted(set(paths) - self.seen)
+                self.seen.update(new_paths)
+                self.__pending.extend(new_paths)
+            if self.__pending:
+                return self.__pending.popleft()
+            if self.idle_timeout is not None and idle >= self.idle_timeout:
+                raise StopAsyncIteration
+            await asyncio.sleep(self.poll_interval)
+            idle += self.poll_interval
+
+
+class GridIngestor(object):
+    """
+    GridIngestor objects read grid files from an asynchronous iterator of
+    paths and push them to a Cell_tracks object in order of their scan time.
+    Grids are decoded in an executor, off the event loop, and handed to the
+    tracker through a bounded queue, so reading pauses while the tracker is
+    behind. Grids arriving out of order are sorted within a window of
+    reorder_size grids. Grids older than the last grid tracked can no longer
+    be linked and are skipped.
+
+    Attributes
+    ----------
+    tracks_obj : Cell_tracks
+        Tracker fed with Cell_tracks.push.
+    reader : function
+        Reads a grid from a path. Default is pyart.io.read_grid.
+    queue_size : int
+        Maximum number of decoded grids waiting for the tracker.
+    reorder_size : int
+        Number of grids held back to sort late arrivals. 0 tracks grids in
+        order of arrival.
+    executor : Executor
+        Executor in which grids are decoded. None uses the default executor
+        of the event loop. Tracking always runs in the default executor.
+    callback : function
+        If given, called with the path and the rows returned by push after
+        each grid is tracked.
+    last_time : datetime
+        Scan time of the last grid tracked.
+    late : list
+        Paths of grids skipped because they arrived too late.
+
+    """
+
+    def __init__(self, tracks_obj, reader=None, queue_size=4, reorder_size=1,
+                 executor=None, callback=None):
+        if reader is None:
+            import pyart
+            reader = pyart.io.read_grid
+        self.tracks_obj = tracks_obj
+        self.reader = reader
+        self.queue_size = queue_size
+        self.reorder_size = reorder_size
+        self.executor = executor
+        self.callback = callback
+        self.last_time = None
+        self.late = []
+
+    async def run(self, paths):
+        """ Tracks the grids of the asynchronous iterable paths, such as a
+        DirectoryWatcher. Returns when paths is exhausted and every grid read
+        has been tracked. Errors of the reader are raised once the grids read
+        before them have been tracked. """
+        loop = asyncio.get_event_loop()
+        queue = asyncio.Queue(self.queue_size)
+        reading = asyncio.ensure_future(self.__read(paths, queue, loop))
+        try:
+            await self.__track(queue, loop)
+        except BaseException:
+            # emptying the queue lets the cancelled reader queue its end
+            reading.cancel()
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.gather(reading, return_exceptions=True)
+            raise
+        await reading
+
+    async def __read(self, paths, queue, loop):
+        """ Decodes grids and puts them in the queue, waiting while it is
+        full. None marks the end of paths, and is queued even if reading
+        fails, so that the tracker never waits for grids that will not
+        come. """
+        try:
+            async for path in paths:
+                grid_obj = await loop.run_in_executor(self.executor,
+                                                      self.reader, path)
+                await queue.put((parse_grid_datetime(grid_obj), path,
+                                 grid_obj))
+        finally:
+            await queue.put(None)
+
+    async def __track(self, queue, loop):
+        """ Takes grids from the queue and tracks them in order of scan
+        time. """
+        held = []
+        order = itertools.count()
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            scan_time, path, grid_obj = item
+            heapq.heappush(held, (scan_time, next(order), path, grid_obj))
+            if len(held) > self.reorder_size:
+                await self.__push(heapq.heappop(held), loop)
+        while held:
+            await self.__push(heapq.heappop(held), loop)
+
+    async def __push(self, item, loop):
+        """ Pushes one grid to the tracker unless it is late. """
+        scan_time, _, path, grid_obj = item
+        if self.last_time is not None and scan_time <= self.last_time:
+            self.late.append(path)
+            return
+        rows = await loop.run_in_executor(None, self.tracks_obj.push,
+                                          grid_obj)
+        self.last_time = scan_time
+        if self.callback is not None:
+            self.callback(path, rows)
+
+
+def track_directory(tracks_obj, path, pattern='*.nc', poll_interval=1.0,
+                    idle_timeout=None, **kwargs):
+    """ Tracks grid files as they appear in the directory path until no new
+    file was found for idle_timeout seconds. Further keyword arguments are
+    passed to GridIngestor, which is returned. """
+    ingestor = GridIngestor(tracks_obj, **kwargs)
+    watcher = DirectoryWatcher(path, pattern, poll_interval, idle_timeout)
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(ingestor.run(watcher))
+    finally:
+        loop.close()
+    return ingestor
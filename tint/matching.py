@@ -6,12 +6,14 @@ Functions for object matching between adjacent radar scans.
 
 """
 
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
 from scipy import optimize
 
-from .phase_correlation import get_ambient_flow
-from .objects import get_obj_extent
+from .phase_correlation import get_ambient_flows
+from .objects import get_object_table, get_table_extent
 
 
 LARGE_NUM = 1000
@@ -78,6 +80,18 @@ def correct_shift(local_shift, current_objects, obj_id1, global_shift, record,
     Note: At the time of this function call, current_objects has not yet been
     updated for the current frame1 and frame2, so the id2s in current_objects
     correspond to the objects in the current frame1. """
+    shift_record = get_corrected_shift(local_shift, current_objects, obj_id1,
+                                       global_shift, record, params)
+    record.count_case(shift_record[4])
+    record.record_shift(*shift_record)
+    return shift_record[0]
+
+
+def get_corrected_shift(local_shift, current_objects, obj_id1, global_shift,
+                        record, params):
+    """ Performs the shift correction of correct_shift without updating
+    record. Returns the arguments of Record.record_shift: corrected shift,
+    clipped global shift, last heads, local shift and case. """
     global_shift = clip_shift(global_shift, record, params)
 
     if current_objects is None:
@@ -110,11 +124,7 @@ def correct_shift(local_shift, current_objects, obj_id1, global_shift, record,
         corrected_shift = (local_shift + last_heads)/2
 
     corrected_shift = np.round(corrected_shift, 2)
-
-    record.count_case(case)
-    record.record_shift(corrected_shift, global_shift,
-                        last_heads, local_shift, case)
-    return corrected_shift
+    return corrected_shift, global_shift, last_heads, local_shift, case
 
 
 def predict_search_extent(obj1_extent, shift, params, grid_size):
@@ -152,12 +162,12 @@ def check_search_box(search_box, img_dims):
     return search_box
 
 
-def get_disparity(obj_found, image2, search_box, obj1_extent):
+def get_disparity(obj_found, obj_table2, search_box, obj1_extent):
     """ Computes disparities for objects in obj_found. """
     dist_pred = np.empty(0)
     change = np.empty(0)
     for target_obj in obj_found:
-        target_extent = get_obj_extent(image2, target_obj)
+        target_extent = get_table_extent(obj_table2, target_obj)
         euc_dist = euclidean_dist(target_extent['obj_center'],
                                   search_box['center_pred'])
         dist_pred = np.append(dist_pred, euc_dist)
@@ -169,13 +179,13 @@ def get_disparity(obj_found, image2, search_box, obj1_extent):
     return disparity
 
 
-def get_disparity_all(obj_found, image2, search_box, obj1_extent):
+def get_disparity_all(obj_found, obj_table2, search_box, obj1_extent):
     """ Returns disparities of all objects found within the search box. """
     if np.max(obj_found) <= 0:
         disparity = np.array([LARGE_NUM])
     else:
         obj_found = obj_found[obj_found > 0]
-        disparity = get_disparity(obj_found, image2,
+        disparity = get_disparity(obj_found, obj_table2,
                                   search_box, obj1_extent)
     return disparity
 
@@ -192,10 +202,40 @@ def save_obj_match(obj_id1, obj_found, disparity, obj_match, params):
     return obj_match
 
 
+def match_object(obj_id1, obj_table1, obj_table2, image2, flows, global_shift,
+                 current_objects, record, params):
+    """ Locates one object of image1 in image2 without updating record, so
+    that objects may be matched in parallel. Returns the objects found, their
+    disparities, the correction cases to count and the shift to record. """
+    obj1_extent = get_table_extent(obj_table1, obj_id1)
+    shift = flows[obj_id1 - 1]
+    cases = []
+    if np.any(np.isnan(shift)):
+        cases.append(5)
+        shift = global_shift
+
+    shift_record = get_corrected_shift(shift, current_objects, obj_id1,
+                                       global_shift, record, params)
+    cases.append(shift_record[4])
+
+    search_box = predict_search_extent(obj1_extent, shift_record[0],
+                                       params, record.grid_size)
+    search_box = check_search_box(search_box, image2.shape)
+    objs_found = find_objects(search_box, image2)
+    disparity = get_disparity_all(objs_found, obj_table2,
+                                  search_box, obj1_extent)
+    return objs_found, disparity, cases, shift_record
+
+
 def locate_all_objects(image1, image2, global_shift, current_objects, record,
-                       params):
+                       params, obj_table1=None, obj_table2=None,
+                       fft_engine=None, workers=None):
     """ Matches all the objects in image1 to objects in image2. This is the
-    main function called on a pair of images. """
+    main function called on a pair of images. Object tables of the two images
+    are built if not given. Ambient flows of all objects are computed at once,
+    see get_ambient_flows. If workers is greater than 1, objects are matched
+    in a thread pool; record updates are applied afterwards in object order,
+    so results do not depend on workers. """
     nobj1 = np.max(image1)
     nobj2 = np.max(image2)
 
@@ -203,28 +243,35 @@ def locate_all_objects(image1, image2, global_shift, current_objects, record,
         print('No echoes to track!')
         return
 
+    if obj_table1 is None:
+        obj_table1 = get_object_table(image1)
+    if obj_table2 is None:
+        obj_table2 = get_object_table(image2)
+
     obj_match = np.full((nobj1, np.max((nobj1, nobj2))),
                         LARGE_NUM, dtype='f')
+    flows = get_ambient_flows(obj_table1, image1, image2, params,
+                              record.grid_size, fft_engine)
+
+    def match(obj_id1):
+        return match_object(obj_id1, obj_table1, obj_table2, image2, flows,
+                            global_shift, current_objects, record, params)
 
-    for obj_id1 in np.arange(nobj1) + 1:
-        obj1_extent = get_obj_extent(image1, obj_id1)
-        shift = get_ambient_flow(obj1_extent, image1,
-                                 image2, params, record.grid_size)
-        if shift is None:
-            record.count_case(5)
-            shift = global_shift
-
-        shift = correct_shift(shift, current_objects, obj_id1,
-                              global_shift, record, params)
-
-        search_box = predict_search_extent(obj1_extent, shift,
-                                           params, record.grid_size)
-        search_box = check_search_box(search_box, image2.shape)
-        objs_found = find_objects(search_box, image2)
-        disparity = get_disparity_all(objs_found, image2,
-                                      search_box, obj1_extent)
+    obj_ids1 = np.arange(nobj1) + 1
+    if workers is not None and workers > 1:
+        with ThreadPoolExecutor(workers) as pool:
+            matches = list(pool.map(match, obj_ids1))
+    else:
+        matches = [match(obj_id1) for obj_id1 in obj_ids1]
+
+    for obj_id1, (objs_found, disparity, cases, shift_record) in zip(obj_ids1,
+                                                                     matches):
+        for case in cases:
+            record.count_case(case)
+        record.record_shift(*shift_record)
         obj_match = save_obj_match(obj_id1, objs_found, disparity, obj_match,
                                    params)
+    record.count_candidates(int(np.sum(obj_match < LARGE_NUM)))
     return obj_match
 
 
@@ -242,9 +289,12 @@ def match_pairs(obj_match, params):
     return pairs
 
 
-def get_pairs(image1, image2, global_shift, current_objects, record, params):
+def get_pairs(image1, image2, global_shift, current_objects, record, params,
+              obj_table1=None, obj_table2=None, fft_engine=None,
+              workers=None):
     """ Given two images, this function identifies the matching objects and
-    pairs them appropriately. See disparity function. """
+    pairs them appropriately. See disparity function and
+    locate_all_objects. """
     nobj1 = np.max(image1)
     nobj2 = np.max(image2)
 
@@ -260,6 +310,10 @@ def get_pairs(image1, image2, global_shift, current_objects, record, params):
                                    global_shift,
                                    current_objects,
                                    record,
-                                   params)
+                                   params,
+                                   obj_table1,
+                                   obj_table2,
+                                   fft_engine,
+                                   workers)
     pairs = match_pairs(obj_match, params)
     return pairs
@@ -39,10 +39,61 @@ def get_obj_extent(labeled_image, obj_label):
     return obj_extent
 
 
-def init_current_objects(first_frame, second_frame, pairs, counter):
+def get_object_table(labeled_image):
+    """ Returns a table of extents for all objects in labeled image. The image
+    is scanned once: pixels are sorted by label, so that the pixel indices of
+    object i are pixels[offsets[i-1]:offsets[i]] in the same order as
+    np.argwhere. Bounding boxes are obtained from ndimage.find_objects. """
+    nobj = np.max(labeled_image)
+    flat = labeled_image.ravel()
+    counts = np.bincount(flat, minlength=nobj+1)
+    order = np.argsort(flat, kind='stable')[counts[0]:]
+    pixels = np.column_stack(np.unravel_index(order, labeled_image.shape))
+    offsets = np.append(0, np.cumsum(counts[1:]))
+    bbox = ndimage.find_objects(labeled_image, max_label=nobj)
+
+    median = np.empty((nobj, 2))
+    radius = np.empty(nobj)
+    for obj in range(nobj):
+        median[obj] = np.median(pixels[offsets[obj]:offsets[obj+1]], axis=0)
+        xlength = bbox[obj][0].stop - bbox[obj][0].start
+        ylength = bbox[obj][1].stop - bbox[obj][1].start
+        radius[obj] = np.max((xlength, ylength))/2
+
+    obj_table = {'nobj': nobj,
+                 'pixels': pixels,
+                 'offsets': offsets,
+                 'bbox': bbox,
+                 'area': counts[1:],
+                 'median': median,
+                 'center': np.round(median, 0),
+                 'radius': radius}
+    return obj_table
+
+
+def get_table_index(obj_table, obj_label):
+    """ Returns pixel indices of the given object from object table. """
+    offsets = obj_table['offsets']
+    return obj_table['pixels'][offsets[obj_label-1]:offsets[obj_label]]
+
+
+def get_table_extent(obj_table, obj_label):
+    """ Returns the radius, area, and center of the given object from object
+    table. This is equivalent to get_obj_extent without rescanning the image.
+    """
+    obj_extent = {'obj_center': obj_table['center'][obj_label-1],
+                  'obj_radius': obj_table['radius'][obj_label-1],
+                  'obj_area': obj_table['area'][obj_label-1],
+                  'obj_index': get_table_index(obj_table, obj_label)}
+    return obj_extent
+
+
+def init_current_objects(first_frame, second_frame, pairs, counter,
+                         obj_table1=None, obj_table2=None):
     """ Returns a dictionary for objects with unique ids and their
     corresponding ids in frame1 and frame1. This function is called when
-    echoes are detected after a period of no echoes. """
+    echoes are detected after a period of no echoes. Object tables of the two
+    frames are built if not given. """
     nobj = np.max(first_frame)
 
     id1 = np.arange(nobj) + 1
@@ -54,11 +105,13 @@ def init_current_objects(first_frame, second_frame, pairs, counter):
     current_objects = {'id1': id1, 'uid': uid, 'id2': id2,
                        'obs_num': obs_num, 'origin': origin}
     current_objects = attach_last_heads(first_frame, second_frame,
-                                        current_objects)
+                                        current_objects, obj_table1,
+                                        obj_table2)
     return current_objects, counter
 
 
-def update_current_objects(frame1, frame2, pairs, old_objects, counter):
+def update_current_objects(frame1, frame2, pairs, old_objects, counter,
+                           obj_table1=None, obj_table2=None):
     """ Removes dead objects, updates living objects, and assigns new uids to
     new-born objects. """
     nobj = np.max(frame1)
@@ -86,19 +139,44 @@ def update_current_objects(frame1, frame2, pairs, old_objects, counter):
     id2 = pairs
     current_objects = {'id1': id1, 'uid': uid, 'id2': id2,
                        'obs_num': obs_num, 'origin': origin}
-    current_objects = attach_last_heads(frame1, frame2, current_objects)
+    current_objects = attach_last_heads(frame1, frame2, current_objects,
+                                        obj_table1, obj_table2)
     return current_objects, counter
 
 
-def attach_last_heads(frame1, frame2, current_objects):
+def same_objects(objects1, objects2):
+    """ Returns True if two current_objects dictionaries link the same
+    objects with the same last heads, so that tracking continues alike from
+    both. uids and observation counts are not compared. """
+    if objects1 is None or objects2 is None:
+        return objects1 is None and objects2 is None
+    for key in ('id1', 'id2'):
+        if not np.array_equal(objects1[key], objects2[key]):
+            return False
+    heads1 = np.ma.asarray(objects1['last_heads'])
+    heads2 = np.ma.asarray(objects2['last_heads'])
+    return (np.array_equal(np.ma.getmaskarray(heads1),
+                           np.ma.getmaskarray(heads2))
+            and np.array_equal(heads1.filled(0), heads2.filled(0)))
+
+
+def attach_last_heads(frame1, frame2, current_objects, obj_table1=None,
+                      obj_table2=None):
     """ Attaches last heading information to current_objects dictionary. """
+    if obj_table1 is None:
+        obj_table1 = get_object_table(frame1)
+    if obj_table2 is None:
+        obj_table2 = get_object_table(frame2)
+    centers1 = obj_table1['median'].astype('i')
+    centers2 = obj_table2['median'].astype('i')
+
     nobj = len(current_objects['uid'])
     heads = np.ma.empty((nobj, 2))
     for obj in range(nobj):
         if ((current_objects['id1'][obj] > 0) and
                 (current_objects['id2'][obj] > 0)):
-            center1 = get_object_center(current_objects['id1'][obj], frame1)
-            center2 = get_object_center(current_objects['id2'][obj], frame2)
+            center1 = centers1[current_objects['id1'][obj] - 1]
+            center2 = centers2[current_objects['id2'][obj] - 1]
             heads[obj, :] = center2 - center1
         else:
             heads[obj, :] = np.ma.array([-999, -999], mask=[True, True])
@@ -119,39 +197,79 @@ def check_isolation(raw, filtered, grid_size, params):
     nobj_iso = np.max(iso_filtered)
     iso = np.empty(nobj, dtype='bool')
 
+    # peaks and objects per isolation region from single labeled reductions
+    peaks = get_local_maxima(raw, params)
+    npeaks = np.bincount(iso_filtered[peaks], minlength=nobj_iso+1)
+    overlap = (iso_filtered > 0) & (filtered > 0)
+    links = np.unique(iso_filtered[overlap].astype('i8') * (nobj + 1)
+                      + filtered[overlap])
+    link_iso = links // (nobj + 1)
+    link_obj = links % (nobj + 1)
+    bounds = np.searchsorted(link_iso, np.arange(nobj_iso + 2))
+
     for iso_id in np.arange(nobj_iso) + 1:
-        obj_ind = np.where(iso_filtered == iso_id)
-        objects = np.unique(filtered[obj_ind])
-        objects = objects[objects != 0]
-        if len(objects) == 1 and single_max(obj_ind, raw, params):
+        objects = link_obj[bounds[iso_id]:bounds[iso_id+1]]
+        if len(objects) == 1 and npeaks[iso_id] <= 1:
             iso[objects - 1] = True
         else:
             iso[objects - 1] = False
     return iso
 
 
-def single_max(obj_ind, raw, params):
-    """ Returns True if object has at most one peak. """
+def get_local_maxima(raw, params):
+    """ Returns boolean map of peaks in the smoothed maximum projection of raw.
+    A pixel is a peak if it is the first occurrence of the maximum of its 3x3
+    neighborhood, with the frame padded by zeros. The map is computed once per
+    scan and shared by all isolation regions. """
     max_proj = np.max(raw, axis=0)
     smooth = ndimage.filters.gaussian_filter(max_proj, params['ISO_SMOOTH'])
     padded = np.pad(smooth, 1, mode='constant')
-    obj_ind = [axis + 1 for axis in obj_ind]  # adjust for padding
-    maxima = 0
-    for pixel in range(len(obj_ind[0])):
-        ind_0 = obj_ind[0][pixel]
-        ind_1 = obj_ind[1][pixel]
-        neighborhood = padded[(ind_0-1):(ind_0+2), (ind_1-1):(ind_1+2)]
-        max_ind = np.unravel_index(neighborhood.argmax(), neighborhood.shape)
-        if max_ind == (1, 1):
-            maxima += 1
-            if maxima > 1:
-                return False
-    return True
-
-
-def get_object_prop(image1, grid1, field, record, params):
+    rows, cols = smooth.shape
+    peaks = np.ones(smooth.shape, dtype='bool')
+    for offset in [(0, 0), (0, 1), (0, 2), (1, 0),
+                   (1, 2), (2, 0), (2, 1), (2, 2)]:
+        neighbor = padded[offset[0]:offset[0]+rows, offset[1]:offset[1]+cols]
+        if offset < (1, 1):
+            # argmax returns the first maximum, so earlier neighbors must be
+            # strictly smaller
+            peaks &= smooth > neighbor
+        else:
+            peaks &= smooth >= neighbor
+    return peaks
+
+
+def single_max(obj_ind, raw, params, peaks=None):
+    """ Returns True if object has at most one peak. The peak map from
+    get_local_maxima is computed if not given. """
+    if peaks is None:
+        peaks = get_local_maxima(raw, params)
+    return np.count_nonzero(peaks[obj_ind]) <= 1
+
+
+def get_column_stats(raw3D, labeled_image, thresh):
+    """ Returns column statistics of the 3D field for all objects in labeled
+    image, computed with one pass over the volume instead of per object.
+    field_max is the maximum of the field over the object columns, top_index
+    the highest z-index above thresh, and voxels the number of voxels above
+    thresh. """
+    index = np.arange(np.max(labeled_image)) + 1
+    above = raw3D > thresh
+    top = raw3D.shape[0] - 1 - np.argmax(above[::-1], axis=0)
+    top[~np.any(above, axis=0)] = -1
+    voxels = np.bincount(labeled_image.ravel(),
+                         weights=np.sum(above, axis=0).ravel(),
+                         minlength=len(index)+1)
+
+    column_stats = {'field_max': ndimage.maximum(np.max(raw3D, axis=0),
+                                                 labeled_image, index),
+                    'top_index': ndimage.maximum(top, labeled_image, index),
+                    'voxels': voxels[1:].astype('i')}
+    return column_stats
+
+
+def get_object_prop(image1, grid1, field, record, params, obj_table=None):
     """ Returns dictionary of object properties for all objects found in
-    image1. """
+    image1. The object table of image1 is built if not given. """
     id1 = []
     center = []
     grid_x = []
@@ -159,9 +277,6 @@ def get_object_prop(image1, grid1, field, record, params):
     area = []
     longitude = []
     latitude = []
-    field_max = []
-    max_height = []
-    volume = []
     nobj = np.max(image1)
 
     unit_dim = record.grid_size
@@ -170,13 +285,22 @@ def get_object_prop(image1, grid1, field, record, params):
     unit_vol = (unit_dim[0]*unit_dim[1]*unit_dim[2])/(1000**3)
 
     raw3D = grid1.fields[field]['data'].data
+    if obj_table is None:
+        obj_table = get_object_table(image1)
+    projparams = grid1.get_projparams()
+
+    # raw 3D grid stats
+    column_stats = get_column_stats(raw3D, image1, params['FIELD_THRESH'])
+    field_max = list(column_stats['field_max'])
+    max_height = list(column_stats['top_index'] * unit_alt)
+    volume = list(column_stats['voxels'] * unit_vol)
 
     for obj in np.arange(nobj) + 1:
-        obj_index = np.argwhere(image1 == obj)
+        obj_index = get_table_index(obj_table, obj)
         id1.append(obj)
 
         # 2D frame stats
-        center.append(np.median(obj_index, axis=0))
+        center.append(obj_table['median'][obj-1])
         this_centroid = np.round(np.mean(obj_index, axis=0), 3)
         grid_x.append(this_centroid[1])
         grid_y.append(this_centroid[0])
@@ -186,7 +310,6 @@ def get_object_prop(image1, grid1, field, record, params):
         cent_met = np.array([grid1.y['data'][rounded[0]],
                              grid1.x['data'][rounded[1]]])
 
-        projparams = grid1.get_projparams()
         lon, lat = pyart.core.transforms.cartesian_to_geographic(cent_met[1],
                                                                  cent_met[0],
                                                                  projparams)
@@ -194,15 +317,6 @@ def get_object_prop(image1, grid1, field, record, params):
         longitude.append(np.round(lon[0], 4))
         latitude.append(np.round(lat[0], 4))
 
-        # raw 3D grid stats
-        obj_slices = [raw3D[:, ind[0], ind[1]] for ind in obj_index]
-        field_max.append(np.max(obj_slices))
-        filtered_slices = [obj_slice > params['FIELD_THRESH']
-                           for obj_slice in obj_slices]
-        heights = [np.arange(raw3D.shape[0])[ind] for ind in filtered_slices]
-        max_height.append(np.max(np.concatenate(heights)) * unit_alt)
-        volume.append(np.sum(filtered_slices) * unit_vol)
-
     # cell isolation
     isolation = check_isolation(raw3D, image1, record.grid_size, params)
 
@@ -220,18 +334,14 @@ def get_object_prop(image1, grid1, field, record, params):
     return objprop
 
 
-def write_tracks(old_tracks, record, current_objects, obj_props):
-    """ Writes all cell information to tracks dataframe. """
-    print('Writing tracks for scan', record.scan)
-
+def get_track_columns(record, current_objects, obj_props):
+    """ Returns dictionary of tracks columns for all objects in the current
+    scan. """
     nobj = len(obj_props['id1'])
-    scan_num = [record.scan] * nobj
-    uid = current_objects['uid']
-
-    new_tracks = pd.DataFrame({
-        'scan': scan_num,
-        'uid': uid,
-        'time': record.time,
+    columns = {
+        'scan': np.full(nobj, record.scan),
+        'uid': current_objects['uid'],
+        'time': np.full(nobj, np.datetime64(record.time, 'ns')),
         'grid_x': obj_props['grid_x'],
         'grid_y': obj_props['grid_y'],
         'lon': obj_props['lon'],
@@ -241,7 +351,17 @@ def write_tracks(old_tracks, record, current_objects, obj_props):
         'max': obj_props['field_max'],
         'max_alt': obj_props['max_height'],
         'isolated': obj_props['isolated']
-    })
+    }
+    return columns
+
+
+def write_tracks(old_tracks, record, current_objects, obj_props):
+    """ Writes all cell information to tracks dataframe. This copies
+    old_tracks; Cell_tracks accumulates columns in a TracksBuffer instead. """
+    print('Writing tracks for scan', record.scan)
+
+    new_tracks = pd.DataFrame(get_track_columns(record, current_objects,
+                                                obj_props))
     new_tracks.set_index(['scan', 'uid'], inplace=True)
-    tracks = old_tracks.append(new_tracks)
+    tracks = pd.concat([old_tracks, new_tracks])
     return tracks
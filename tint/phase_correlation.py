@@ -8,28 +8,119 @@ between scans.
 import numpy as np
 from scipy import ndimage
 
+try:
+    import scipy.fft as scipy_fft
+except ImportError:
+    scipy_fft = None
 
-def get_ambient_flow(obj_extent, img1, img2, params, grid_size):
-    """ Takes in object extent and two images and returns ambient flow. Margin
-    is the additional region around the object used to compute the flow
-    vectors. """
+MAX_BATCH_PIXELS = 2**24  # padded pixels per stacked FFT in get_ambient_flows
+
+
+class FFTEngine(object):
+    """
+    FFTEngine objects compute the spectra and cross covariance matrices used
+    in phase correlation. The default engine reproduces the original complex
+    FFT path; the other backends may be selected to compare speed.
+
+    Attributes
+    ----------
+    backend : str
+        'numpy' uses the complex np.fft.fft2 of the full frame. 'rfft' uses the
+        real-input np.fft.rfft2. 'scipy' uses the real-input scipy.fft.rfft2
+        with worker threads.
+    workers : int
+        Number of threads used by the 'scipy' backend. See scipy.fft.
+    precision : str
+        'double' or 'single'. Single precision is only used by the 'scipy'
+        backend.
+    fast_len : bool
+        If True, images are zero padded to fast FFT lengths. Padding changes
+        the wrap-around of the cross covariance, so shifts may differ slightly
+        from the unpadded result.
+
+    """
+
+    def __init__(self, backend='numpy', workers=None, precision='double',
+                 fast_len=False):
+        if backend not in ('numpy', 'rfft', 'scipy'):
+            raise ValueError('unknown FFT backend ' + str(backend))
+        if backend == 'scipy' and scipy_fft is None:
+            raise ImportError('scipy.fft is required for the scipy backend')
+        if precision not in ('double', 'single'):
+            raise ValueError('precision must be double or single')
+        self.backend = backend
+        self.workers = workers
+        self.precision = precision
+        self.fast_len = fast_len
+
+    def get_shape(self, shape):
+        """ Returns the shape of the transform for images of given shape. """
+        if not self.fast_len:
+            return tuple(shape)
+        real = self.backend != 'numpy'
+        return tuple(scipy_fft.next_fast_len(int(n), real) for n in shape)
+
+    def spectrum(self, image):
+        """ Returns the spectrum of image. A stack of images may be given, in
+        which case the transform is taken over the last two axes. """
+        if self.backend == 'numpy':
+            if self.fast_len:
+                return np.fft.fft2(image, s=self.get_shape(image.shape[-2:]))
+            return np.fft.fft2(image)
+        shape = self.get_shape(image.shape[-2:])
+        if self.backend == 'rfft':
+            return np.fft.rfft2(image, s=shape)
+        if self.precision == 'single':
+            image = image.astype('float32')
+        return scipy_fft.rfft2(image, s=shape, workers=self.workers)
+
+    def crosscov(self, fft1, fft2, shape):
+        """ Returns the centered cross covariance matrix given the spectra of
+        two images of given shape. See fft_shift for the centering. """
+        shape = self.get_shape(shape)
+        cross_power_spectrum = fft2 * np.conj(fft1)
+        normalize = abs(cross_power_spectrum)
+        normalize[normalize == 0] = 1  # prevent divide by zero error
+        cross_power_spectrum /= normalize
+        if self.backend == 'numpy':
+            crosscov = np.real(np.fft.ifft2(cross_power_spectrum))
+        elif self.backend == 'rfft':
+            crosscov = np.fft.irfft2(cross_power_spectrum, s=shape)
+        else:
+            crosscov = scipy_fft.irfft2(cross_power_spectrum, s=shape,
+                                        workers=self.workers)
+        # equivalent to fft_shift, without the concatenation copies
+        return np.fft.fftshift(crosscov, axes=(-2, -1))
+
+
+def get_flow_region(obj_center, obj_radius, params, grid_size, dims):
+    """ Returns the row and column bounds of the flow region around an object,
+    clipped to the frame. Upper bounds are inclusive. """
     margin_r = params['FLOW_MARGIN'] / grid_size[1]
     margin_c = params['FLOW_MARGIN'] / grid_size[2]
-    row_lb = obj_extent['obj_center'][0] - obj_extent['obj_radius'] - margin_r
-    row_ub = obj_extent['obj_center'][0] + obj_extent['obj_radius'] + margin_r
-    col_lb = obj_extent['obj_center'][1] - obj_extent['obj_radius'] - margin_c
-    col_ub = obj_extent['obj_center'][1] + obj_extent['obj_radius'] + margin_c
+    row_lb = obj_center[0] - obj_radius - margin_r
+    row_ub = obj_center[0] + obj_radius + margin_r
+    col_lb = obj_center[1] - obj_radius - margin_c
+    col_ub = obj_center[1] + obj_radius + margin_c
     row_lb = np.int64(row_lb)
     row_ub = np.int64(row_ub)
     col_lb = np.int64(col_lb)
     col_ub = np.int64(col_ub)
 
-    dims = img1.shape
-
     row_lb = np.max([row_lb, 0])
     row_ub = np.min([row_ub, dims[0]])
     col_lb = np.max([col_lb, 0])
-    col_ub = np.max([col_ub, dims[1]])
+    col_ub = np.min([col_ub, dims[1]])
+    return row_lb, row_ub, col_lb, col_ub
+
+
+def get_ambient_flow(obj_extent, img1, img2, params, grid_size):
+    """ Takes in object extent and two images and returns ambient flow. Margin
+    is the additional region around the object used to compute the flow
+    vectors. """
+    row_lb, row_ub, col_lb, col_ub = get_flow_region(
+        obj_extent['obj_center'], obj_extent['obj_radius'], params, grid_size,
+        img1.shape)
 
     flow_region1 = np.copy(img1[row_lb:row_ub+1, col_lb:col_ub+1])
     flow_region2 = np.copy(img2[row_lb:row_ub+1, col_lb:col_ub+1])
@@ -39,18 +130,77 @@ def get_ambient_flow(obj_extent, img1, img2, params, grid_size):
     return fft_flowvectors(flow_region1, flow_region2)
 
 
-def fft_flowvectors(im1, im2, global_shift=False):
-    """ Estimates flow vectors in two images using cross covariance. """
+def get_bucket_length(length):
+    """ Returns the smallest length of the form 2**k or 3*2**k that is not
+    less than length. Flow regions are padded to these lengths so that they
+    fall into a few buckets of fast FFT sizes. """
+    power = 2**int(np.ceil(np.log2(length)))
+    if 3*power/4 >= length:
+        return int(3*power/4)
+    return power
+
+
+def get_ambient_flows(obj_table, img1, img2, params, grid_size, engine=None):
+    """ Returns ambient flow of all objects in obj_table as an array of
+    shifts. Flow regions are zero padded to bucket sizes and each bucket is
+    transformed as one stack. Objects with empty flow regions get NaN shifts.
+    See get_ambient_flow for the flow of a single object. """
+    if engine is None:
+        engine = FFTEngine()
+    shifts = np.full((obj_table['nobj'], 2), np.nan)
+    mask1 = img1 != 0
+    mask2 = img2 != 0
+
+    buckets = {}
+    for obj in range(obj_table['nobj']):
+        row_lb, row_ub, col_lb, col_ub = get_flow_region(
+            obj_table['center'][obj], obj_table['radius'][obj], params,
+            grid_size, img1.shape)
+        region1 = mask1[row_lb:row_ub+1, col_lb:col_ub+1]
+        region2 = mask2[row_lb:row_ub+1, col_lb:col_ub+1]
+        if not (np.any(region1) and np.any(region2)):
+            continue
+        bucket = (get_bucket_length(region1.shape[0]),
+                  get_bucket_length(region1.shape[1]))
+        buckets.setdefault(bucket, []).append((obj, region1, region2))
+
+    for bucket, regions in buckets.items():
+        batch_size = max(1, MAX_BATCH_PIXELS // (bucket[0] * bucket[1]))
+        for start in range(0, len(regions), batch_size):
+            batch = regions[start:start+batch_size]
+            stack1 = np.zeros((len(batch),) + bucket)
+            stack2 = np.zeros((len(batch),) + bucket)
+            for i, (obj, region1, region2) in enumerate(batch):
+                stack1[i, :region1.shape[0], :region1.shape[1]] = region1
+                stack2[i, :region2.shape[0], :region2.shape[1]] = region2
+            crosscov = engine.crosscov(engine.spectrum(stack1),
+                                       engine.spectrum(stack2), bucket)
+            for i, (obj, region1, region2) in enumerate(batch):
+                shifts[obj] = get_peak_shift(crosscov[i],
+                                             (1/8) * min(region1.shape))
+    return shifts
+
+
+def fft_flowvectors(im1, im2, global_shift=False, fft1=None, fft2=None,
+                    engine=None):
+    """ Estimates flow vectors in two images using cross covariance. Spectra
+    of the images from get_spectrum may be given to avoid recomputing them. """
     if not global_shift and (np.max(im1) == 0 or np.max(im2) == 0):
         return None
 
-    crosscov = fft_crosscov(im1, im2)
+    crosscov = fft_crosscov(im1, im2, fft1, fft2, engine)
     sigma = (1/8) * min(crosscov.shape)
+    return get_peak_shift(crosscov, sigma)
+
+
+def get_peak_shift(crosscov, sigma):
+    """ Returns the shift given by the peak of the smoothed, centered cross
+    covariance matrix. """
     cov_smooth = ndimage.filters.gaussian_filter(crosscov, sigma)
-    dims = np.array(im1.shape)
+    dims = np.array(crosscov.shape)
 
     pshift = np.argwhere(cov_smooth == np.max(cov_smooth))[0]
-    
+
     rs = np.ceil(dims[0]/2).astype('int')
     cs = np.ceil(dims[1]/2).astype('int')
 
@@ -59,16 +209,23 @@ def fft_flowvectors(im1, im2, global_shift=False):
     return pshift
 
 
-def fft_crosscov(im1, im2):
-    """ Computes cross correlation matrix using FFT method. """
-    fft1_conj = np.conj(np.fft.fft2(im1))
-    fft2 = np.fft.fft2(im2)
-    normalize = abs(fft2*fft1_conj)
-    normalize[normalize == 0] = 1  # prevent divide by zero error
-    cross_power_spectrum = (fft2*fft1_conj)/normalize
-    crosscov = np.fft.ifft2(cross_power_spectrum)
-    crosscov = np.real(crosscov)
-    return fft_shift(crosscov)
+def get_spectrum(image, engine=None):
+    """ Returns the spectrum of image used by fft_crosscov. """
+    if engine is None:
+        engine = FFTEngine()
+    return engine.spectrum(image)
+
+
+def fft_crosscov(im1, im2, fft1=None, fft2=None, engine=None):
+    """ Computes cross correlation matrix using FFT method. fft1 and fft2 must
+    have been computed with the same engine. """
+    if engine is None:
+        engine = FFTEngine()
+    if fft1 is None:
+        fft1 = engine.spectrum(im1)
+    if fft2 is None:
+        fft2 = engine.spectrum(im2)
+    return engine.crosscov(fft1, fft2, im1.shape)
 
 
 def fft_shift(fft_mat):
@@ -94,10 +251,11 @@ def fft_shift(fft_mat):
         return
 
 
-def get_global_shift(im1, im2, params):
+def get_global_shift(im1, im2, params, fft1=None, fft2=None, engine=None):
     """ Returns standardazied global shift vector. im1 and im2 are full frames
-    of raw DBZ values. """
+    of raw DBZ values. fft1 and fft2 are their spectra, if already known. """
     if im2 is None:
         return None
-    shift = fft_flowvectors(im1, im2, global_shift=True)
+    shift = fft_flowvectors(im1, im2, global_shift=True, fft1=fft1, fft2=fft2,
+                            engine=engine)
     return shift
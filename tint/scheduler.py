@@ -0,0 +1,258 @@
+"""
+tint.scheduler
+==============
+
+Tracking of many radars in parallel, one Cell_tracks object per site.
+
+"""
+
+import copy
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import pandas as pd
+
+from .helpers import TracksBuffer, MetricsTable, grow_rows
+from .tracks import Cell_tracks
+
+
+def get_batch_state(tracks_obj):
+    """ Returns a copy of tracks_obj holding only the state carried forward
+    to the next batch. Shift records, tracks and metrics of finished scans
+    are left out, so the state sent to a worker does not grow with the
+    history of the site. See merge_batch_state. """
+    state = copy.copy(tracks_obj)
+    state.tracks_buffer = TracksBuffer()
+    if tracks_obj.metrics is not None:
+        # hooks are called by merge_batch_state, not by the worker
+        state.metrics = MetricsTable(
+            trace_memory=tracks_obj.metrics.trace_memory)
+    if tracks_obj.record is not None:
+        state.record = copy.copy(tracks_obj.record)
+        state.record.shift_rows = state.record.shift_rows[:0]
+        state.record.nshifts = 0
+    # the tracker of the site is left as it was if the batch fails
+    return copy.deepcopy(state)
+
+
+def merge_batch_state(tracks_obj, state, first_scan):
+    """ Returns the state returned by track_batch with the history of
+    tracks_obj, the tracker it was taken from, added back. Rows of
+    first_scan and later scans are replaced by those of the batch, and the
+    metrics hooks of tracks_obj are called with the rows of the batch. """
+    if tracks_obj.record is not None:
+        nshifts = tracks_obj.record.nshifts + state.record.nshifts
+        shift_rows = grow_rows(tracks_obj.record.shift_rows, nshifts)
+        shift_rows[tracks_obj.record.nshifts:nshifts] = (
+            state.record.shift_rows[:state.record.nshifts])
+        state.record.shift_rows = shift_rows
+        state.record.nshifts = nshifts
+    if tracks_obj.metrics is not None:
+        tracks_obj.metrics.drop_scans(first_scan)
+        tracks_obj.metrics.add_rows(state.metrics.get_columns())
+        state.metrics = tracks_obj.metrics
+    return state
+
+
+def track_batch(tracks_obj, grids, reader=None):
+    """ Tracks a batch of grids of one site, reading them with reader if
+    given. tracks_obj holds only the carried forward state, see
+    get_batch_state. Returns the tracker, without its rows, the columns of
+    the rows written, the first scan written and the time taken. The first
+    scan replaces the last scan of the previous batch. """
+    start_time = time.time()
+    if tracks_obj.record is None:
+        first_scan = 0
+    else:
+        first_scan = tracks_obj.record.scan + 1
+    if reader is not None:
+        grids = (reader(grid) for grid in grids)
+    tracks_obj.get_tracks(iter(grids))
+    columns = tracks_obj.tracks_buffer.get_columns()
+    # rows are kept by the scheduler, not sent back and forth
+    tracks_obj.tracks_buffer = TracksBuffer()
+    return tracks_obj, columns, first_scan, time.time() - start_time
+
+
+class TrackingScheduler(object):
+    """
+    TrackingScheduler objects own independent Cell_tracks objects keyed by
+    radar site and track their grids in a pool of worker processes. Grids of
+    a site are tracked in the order they were submitted: each site has at
+    most one batch in the pool, which carries the state of its tracker
+    without the history of finished scans. Tracks, shift records and metrics
+    of finished scans stay in this process. When a worker is free, the site
+    with the largest estimated backlog, in scans queued times seconds per
+    scan, is scheduled next. Tracks of all sites are collected in a single
+    table with a site column. If a batch fails, its
+    grids are put back in front of the queue of the site, the site is not
+    scheduled again until the next run, and the error is raised once the
+    other sites have been tracked. run retries the batch.
+
+    Attributes
+    ----------
+    workers : int
+        Number of worker processes. None or 1 tracks in this process.
+    reader : function
+        If given, submitted items are file names read with reader in the
+        workers, e.g. pyart.io.read_grid. Otherwise they are grid objects.
+    batch_size : int
+        Maximum number of grids of a site tracked in one batch.
+    tracker_kwargs : dict
+        Keyword arguments of Cell_tracks for sites added by submit. A
+        MetricsTable given as metrics is copied without rows for each site.
+        Its hooks are called in this process as the rows of each batch are
+        collected, so they need not be picklable.
+    trackers : dict
+        Cell_tracks object of each site, with its shift records and metrics.
+        Their rows are in site_tracks.
+    site_tracks : dict
+        TracksBuffer holding the rows of each site.
+    queues : dict
+        Grids of each site waiting to be tracked.
+    scan_cost : dict
+        Moving average of seconds per scan of each site.
+    errors : dict
+        Error raised by the last failed batch of each site in the last run.
+
+    """
+
+    def __init__(self, workers=None, reader=None, batch_size=8,
+                 tracker_kwargs=None):
+        if tracker_kwargs is None:
+            tracker_kwargs = {}
+        self.workers = workers
+        self.reader = reader
+        self.batch_size = batch_size
+        self.tracker_kwargs = tracker_kwargs
+        self.trackers = {}
+        self.site_tracks = {}
+        self.queues = {}
+        self.scan_cost = {}
+        self.errors = {}
+
+    def add_site(self, site, tracks_obj=None):
+        """ Adds a site, with its own tracker if given. Sites are added with
+        a new Cell_tracks object when their first grid is submitted. """
+        if tracks_obj is None:
+            tracker_kwargs = self.tracker_kwargs
+            if tracker_kwargs.get('metrics') is not None:
+                # each site collects its own metrics
+                metrics = tracker_kwargs['metrics']
+                tracker_kwargs = dict(tracker_kwargs, metrics=MetricsTable(
+                    metrics.hooks, metrics.trace_memory))
+            tracks_obj = Cell_tracks(**tracker_kwargs)
+        self.trackers[site] = tracks_obj
+        self.site_tracks[site] = TracksBuffer()
+        self.queues[site] = deque()
+
+    def submit(self, site, grid):
+        """ Queues a grid, or file name if reader is set, of site. """
+        if site not in self.trackers:
+            self.add_site(site)
+        self.queues[site].append(grid)
+
+    def get_cost(self, site):
+        """ Returns estimated seconds to track the grids queued for site. """
+        if site in self.scan_cost:
+            cost = self.scan_cost[site]
+        elif self.scan_cost:
+            cost = sum(self.scan_cost.values()) / len(self.scan_cost)
+        else:
+            cost = 1.0
+        return cost * len(self.queues[site])
+
+    def __next_batch(self, busy):
+        """ Pops the next batch from the site with the largest backlog. """
+        sites = [site for site in self.queues
+                 if self.queues[site] and site not in busy]
+        if not sites:
+            return None, None
+        site = max(sites, key=self.get_cost)
+        queue = self.queues[site]
+        batch = [queue.popleft()
+                 for _ in range(min(self.batch_size, len(queue)))]
+        return site, batch
+
+    def __collect(self, site, result, nscans):
+        """ Stores the tracker and rows returned by track_batch. """
+        tracks_obj, columns, first_scan, seconds = result
+        self.trackers[site] = merge_batch_state(self.trackers[site],
+                                                tracks_obj, first_scan)
+        self.site_tracks[site].drop_scans(first_scan)
+        self.site_tracks[site].append(columns)
+        cost = seconds / nscans
+        if site in self.scan_cost:
+            cost = 0.5 * (self.scan_cost[site] + cost)
+        self.scan_cost[site] = cost
+
+    def __fail(self, site, batch, error):
+        """ Puts a failed batch back in front of the queue of site. """
+        self.queues[site].extendleft(reversed(batch))
+        self.errors[site] = error
+
+    def run(self):
+        """ Tracks all queued grids. More grids can be submitted and run
+        afterwards; tracks continue from the last scan of each site. Raises
+        the first error of a failed batch, if any, after tracking the other
+        sites. """
+        self.errors = {}
+        if self.workers is None or self.workers <= 1:
+            site, batch = self.__next_batch(self.errors)
+            while site is not None:
+                try:
+                    result = track_batch(get_batch_state(self.trackers[site]),
+                                         batch, self.reader)
+                except Exception as error:
+                    self.__fail(site, batch, error)
+                else:
+                    self.__collect(site, result, len(batch))
+                site, batch = self.__next_batch(self.errors)
+            self.__raise_errors()
+            return
+
+        running = {}
+        with ProcessPoolExecutor(self.workers) as pool:
+            while True:
+                while len(running) < self.workers:
+                    busy = [site for site, _ in running.values()]
+                    site, batch = self.__next_batch(busy + list(self.errors))
+                    if site is None:
+                        break
+                    future = pool.submit(track_batch,
+                                         get_batch_state(self.trackers[site]),
+                                         batch, self.reader)
+                    running[future] = (site, batch)
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    site, batch = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as error:
+                        self.__fail(site, batch, error)
+                    else:
+                        self.__collect(site, result, len(batch))
+        self.__raise_errors()
+
+    def __raise_errors(self):
+        """ Raises the error of the first failed site, if any. """
+        for site, error in self.errors.items():
+            raise error
+
+    @property
+    def tracks(self):
+        """ Tracks of all sites, indexed by site, scan and uid. """
+        frames = []
+        for site, site_tracks in self.site_tracks.items():
+            if site_tracks.nrows == 0:
+                continue
+            frame = site_tracks.to_frame()
+            frame.insert(0, 'site', site)
+            frames.append(frame.set_index('site', append=True))
+        if not frames:
+            return pd.DataFrame()
+        tracks = pd.concat(frames)
+        return tracks.reorder_levels(['site', 'scan', 'uid'])
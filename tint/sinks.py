@@ -0,0 +1,169 @@
+"""
+tint.sinks
+==========
+
+Writers that stream tracks to disk while get_tracks is running.
+
+"""
+
+import glob
+import os
+
+import pandas as pd
+
+from .helpers import TracksBuffer
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+class ParquetSink(TracksBuffer):
+    """
+    ParquetSink objects write the rows of the tracks table to a directory of
+    Parquet (or Arrow IPC) files, one file per row group. They are used in
+    place of the in-memory TracksBuffer of Cell_tracks, so memory use stays
+    bounded and finished row groups can be read while tracking continues,
+    e.g. with pyarrow.dataset.dataset(path).
+
+    The rows of the most recent scan are always kept in memory, since
+    get_tracks overwrites the last scan when new grids are added.
+
+    Attributes
+    ----------
+    path : str
+        Directory containing the dataset files.
+    row_group_size : int
+        Number of rows buffered in memory before a file is written.
+    file_format : str
+        'parquet' or 'arrow'.
+    mode : str
+        What to do if path is not empty: 'create' raises ValueError, so that
+        new tracks are never mixed with those of an earlier run, 'overwrite'
+        removes the dataset files in path and 'append' writes files after
+        them.
+    nfiles : int
+        Index of the next file to be written.
+    last_file : tuple
+        Name and scan of the file holding the last scan, if it was written
+        by close. See drop_scans.
+
+    """
+
+    def __init__(self, path, row_group_size=100000, file_format='parquet',
+                 mode='create'):
+        if pa is None:
+            raise ImportError('pyarrow is required to write tracks to disk')
+        if file_format not in ('parquet', 'arrow'):
+            raise ValueError('file_format must be parquet or arrow')
+        if mode not in ('create', 'overwrite', 'append'):
+            raise ValueError('mode must be create, overwrite or append')
+        TracksBuffer.__init__(self)
+        self.path = path
+        self.row_group_size = row_group_size
+        self.file_format = file_format
+        self.mode = mode
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        elif mode == 'create' and len(os.listdir(path)) > 0:
+            raise ValueError(path + ' is not empty, pass mode=overwrite or '
+                             'mode=append to write tracks to it')
+        elif mode == 'overwrite':
+            for file_name in glob.glob(os.path.join(path, 'part-*')):
+                os.remove(file_name)
+        files = self.get_files()
+        if len(files) > 0:
+            self.nfiles = int(os.path.basename(files[-1])[5:10]) + 1
+        else:
+            self.nfiles = 0
+        self.last_file = None
+
+    def get_files(self):
+        """ Returns the sorted list of dataset files in path. """
+        pattern = os.path.join(self.path, 'part-*.' + self.file_format)
+        return sorted(glob.glob(pattern))
+
+    def append(self, new_columns):
+        """ Appends rows and writes a file once row_group_size rows of
+        finished scans are buffered. """
+        TracksBuffer.append(self, new_columns)
+        if self.nrows >= self.row_group_size:
+            scans = self.columns['scan'][:self.nrows]
+            self.flush(int(scans.searchsorted(scans[-1])))
+
+    def flush(self, nrows=None):
+        """ Writes the first nrows buffered rows to a new file. By default all
+        buffered rows are written, which finalizes the last scan. """
+        if nrows is None:
+            nrows = self.nrows
+        if nrows == 0:
+            return None
+        table = pa.Table.from_pydict(
+            dict((name, column[:nrows])
+                 for name, column in self.columns.items()))
+        file_name = os.path.join(self.path, 'part-%05d.%s'
+                                 % (self.nfiles, self.file_format))
+        # write to a temporary name so readers never see partial files
+        tmp_name = file_name + '.tmp'
+        if self.file_format == 'parquet':
+            pq.write_table(table, tmp_name)
+        else:
+            feather.write_feather(table, tmp_name)
+        os.replace(tmp_name, file_name)
+        self.nfiles += 1
+        self.last_file = None
+
+        for name, column in self.columns.items():
+            column[:self.nrows - nrows] = column[nrows:self.nrows]
+        self.nrows -= nrows
+        return file_name
+
+    def drop_scans(self, first_scan):
+        """ Drops rows of first_scan and all later scans. Rows already on disk
+        can only be dropped if they are the last scan written by close. """
+        TracksBuffer.drop_scans(self, first_scan)
+        if self.last_file is not None and self.last_file[1] >= first_scan:
+            os.remove(self.last_file[0])
+            self.last_file = None
+
+    def rollback(self):
+        """ Removes files written after this sink was saved in a checkpoint,
+        since a resumed run writes their rows again. """
+        for file_name in self.get_files():
+            if int(os.path.basename(file_name)[5:10]) >= self.nfiles:
+                os.remove(file_name)
+        if self.last_file is not None and not os.path.exists(
+                self.last_file[0]):
+            self.last_file = None
+
+    def to_frame(self):
+        """ Returns tracks DataFrame of written and buffered rows, indexed by
+        scan and uid. """
+        if self.file_format == 'parquet':
+            frames = [pq.read_table(file_name).to_pandas()
+                      for file_name in self.get_files()]
+        else:
+            frames = [feather.read_feather(file_name)
+                      for file_name in self.get_files()]
+        buffered = TracksBuffer.to_frame(self)
+        if len(buffered) > 0:
+            frames.append(buffered.reset_index())
+        if len(frames) == 0:
+            return pd.DataFrame()
+        tracks = pd.concat(frames, ignore_index=True)
+        tracks.set_index(['scan', 'uid'], inplace=True)
+        return tracks
+
+    def close(self):
+        """ Writes all buffered rows. Call when tracking is finished. The last
+        scan is written to a file of its own, so that it can still be
+        overwritten if get_tracks is called again. """
+        if self.nrows == 0:
+            return
+        scans = self.columns['scan'][:self.nrows]
+        last_scan = scans[-1]
+        self.flush(int(scans.searchsorted(last_scan)))
+        self.last_file = (self.flush(), last_scan)
@@ -0,0 +1,146 @@
+"""
+tint.sweep
+==========
+
+Tracking of the same grids with many sets of tracking parameters, for
+tuning the parameters of a radar.
+
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .cache import CACHE_PARAMS
+from .helpers import preprocess_grid
+from .phase_correlation import get_global_shift
+from .tracks import Cell_tracks
+
+# parameters each stage depends on. Detection is extract_grid_data and
+# get_object_prop, global shift uses the raw slice at GS_ALT, and all other
+# parameters only change matching.
+DETECTION_PARAMS = CACHE_PARAMS
+SHIFT_PARAMS = ['GS_ALT']
+
+
+def get_param_groups(param_sets, names):
+    """ Returns dictionary of the indices of param_sets keyed by their values
+    of names. """
+    groups = {}
+    for index, params in enumerate(param_sets):
+        key = tuple(params[name] for name in names)
+        groups.setdefault(key, []).append(index)
+    return groups
+
+
+def iter_detections(grids, field, param_sets, reader=None, cache=None,
+                    fft_engine=None):
+    """ Yields, for each grid, list of its scan products for each set of
+    detection parameters in param_sets, reading each grid once. If cache, a
+    ScanCache from tint.cache, is given, grids are file names and products
+    are read from the cache where possible. Products hold the grid size and
+    radar location of their grid, see Cell_tracks.track_scans. """
+    if cache is not None:
+        try:
+            for filename in grids:
+                yield cache.get_scans(filename, field, param_sets,
+                                      fft_engine)
+        finally:
+            cache.write_index()
+        return
+    for grid_obj in grids:
+        if reader is not None:
+            grid_obj = reader(grid_obj)
+        yield [preprocess_grid(grid_obj, field, params, fft_engine)
+               for params in param_sets]
+
+
+def track_combinations(grids, param_sets, reader=None, cache=None,
+                       tracker_kwargs=None):
+    """ Tracks grids once for each dictionary of complete tracking parameters
+    in param_sets and returns list of the tracks of each. Scans are detected
+    once for each distinct set of DETECTION_PARAMS and global shifts computed
+    once for each distinct GS_ALT; only matching is done for each parameter
+    set. Grids are streamed: the trackers of all parameter sets advance scan
+    by scan, so only the current and previous products of each detection
+    group are held. tracker_kwargs may not hold metrics, see sweep. """
+    if tracker_kwargs is None:
+        tracker_kwargs = {}
+    if tracker_kwargs.get('metrics') is not None:
+        raise ValueError('sweep does not collect metrics')
+    trackers = []
+    for params in param_sets:
+        tracks_obj = Cell_tracks(**tracker_kwargs)
+        tracks_obj.params = params
+        trackers.append(tracks_obj)
+    template = trackers[0]
+    detection_groups = get_param_groups(param_sets, DETECTION_PARAMS)
+    detection_params = [param_sets[indices[0]]
+                        for indices in detection_groups.values()]
+
+    last_scans = [None] * len(detection_params)
+    for group_scans in iter_detections(grids, template.field,
+                                       detection_params, reader, cache,
+                                       template.fft_engine):
+        shifts = {}
+        for group, (indices, params, scan2) in enumerate(zip(
+                detection_groups.values(), detection_params, group_scans)):
+            scan1 = last_scans[group]
+            shift_key = tuple(params[name] for name in SHIFT_PARAMS)
+            if scan1 is not None and shift_key not in shifts:
+                shifts[shift_key] = get_global_shift(
+                    scan1['raw'], scan2['raw'], params, scan1['spectrum'],
+                    scan2['spectrum'], template.fft_engine)
+            for index in indices:
+                tracks_obj = trackers[index]
+                if scan1 is not None:
+                    tracks_obj.last_scan['global_shift'] = shifts[shift_key]
+                tracks_obj.push_scan(dict(scan2))
+            last_scans[group] = scan2
+    return [tracks_obj.tracks for tracks_obj in trackers]
+
+
+def sweep(grids, param_sets, workers=None, reader=None, cache=None,
+          tracker_kwargs=None):
+    """ Tracks grids, or file names read with reader, once for each
+    dictionary of tracking parameters in param_sets. Parameters not given
+    keep the defaults of Cell_tracks. Grids are streamed scan by scan, see
+    track_combinations. If cache is given, grids are file names, see
+    iter_detections. If workers is greater than 1, the parameter sets, in
+    order of their detection parameters, are split among workers processes,
+    each of which reads the grids and detects the scans of its own parameter
+    sets. Pass file names rather than grids to workers, which otherwise
+    receive copies of all grids. Returns list of the tracks of each
+    parameter set. Metrics are not collected, so tracker_kwargs may not
+    hold metrics. """
+    if tracker_kwargs is None:
+        tracker_kwargs = {}
+    if tracker_kwargs.get('metrics') is not None:
+        raise ValueError('sweep does not collect metrics')
+    tracker_kwargs = dict({'verbose': False}, **tracker_kwargs)
+    template = Cell_tracks(**tracker_kwargs)
+    for params in param_sets:
+        for name in params:
+            if name not in template.params:
+                raise ValueError('unknown tracking parameter ' + name)
+    param_sets = [dict(template.params, **params) for params in param_sets]
+
+    if workers is None or workers <= 1:
+        return track_combinations(grids, param_sets, reader, cache,
+                                  tracker_kwargs)
+
+    grids = list(grids)
+    detection_groups = get_param_groups(param_sets, DETECTION_PARAMS)
+    order = [index for indices in detection_groups.values()
+             for index in indices]
+    parts = [part for part in np.array_split(order, workers) if len(part)]
+    tracks = [None] * len(param_sets)
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(track_combinations, grids,
+                               [param_sets[index] for index in part],
+                               reader, cache, tracker_kwargs)
+                   for part in parts]
+        for part, future in zip(parts, futures):
+            for index, part_tracks in zip(part, future.result()):
+                tracks[index] = part_tracks
+    return tracks
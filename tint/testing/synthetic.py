@@ -0,0 +1,111 @@
+""" Synthetic storm grids for benchmarks and tests. """
+
+import os
+
+import numpy as np
+import pyart
+
+
+def make_storm_grids(nscans=10, shape=(10, 200, 200), ncells=20, seed=0,
+                     spacing=(500., 1000., 1000.), interval=300.,
+                     speed=10., growth=0.03, split_rate=0.05, noise=2.0,
+                     start='2015-07-10T18:34:00Z'):
+    """ Returns list of nscans pyart grids of Gaussian cells of reflectivity
+    moving across a domain of the given (z, y, x) shape and spacing in
+    meters. Cells grow by growth per scan and split in two at split_rate per
+    scan. Gaussian noise of standard deviation noise in dBZ is added to the
+    whole volume. Scans are interval seconds apart, starting at start. """
+    rng = np.random.RandomState(seed)
+    nz, ny, nx = shape
+    dz, dy, dx = spacing
+    limits = ((0, dz*(nz - 1)),
+              (-dy*(ny - 1)/2, dy*(ny - 1)/2),
+              (-dx*(nx - 1)/2, dx*(nx - 1)/2))
+    heights = dz * np.arange(nz)
+
+    # cell state, positions and sizes in pixels, velocities in pixels/scan
+    pos = rng.uniform([0, 0], [ny, nx], (ncells, 2))
+    heading = rng.normal(np.pi/4, 0.3, ncells)
+    vel = (rng.normal(speed, speed/4, ncells)[:, np.newaxis] * interval
+           / np.array([dy, dx])
+           * np.column_stack([np.sin(heading), np.cos(heading)]))
+    amp = rng.uniform(40, 60, ncells)
+    sigma = rng.uniform(2, 6, ncells)
+    top = rng.uniform(0.3, 1, ncells) * heights[-1]
+
+    grids = []
+    for scan in range(nscans):
+        data = np.zeros(shape)
+        if noise > 0:
+            data += rng.normal(0, noise, shape)
+        for cell in range(len(amp)):
+            draw_cell(data, pos[cell], sigma[cell], amp[cell], top[cell],
+                      heights)
+
+        grid_obj = pyart.testing.make_empty_grid(shape, limits)
+        grid_obj.time['units'] = 'seconds since ' + start
+        grid_obj.time['data'] = np.array([interval * scan])
+        field = np.ma.masked_less(data, 0)
+        field.data[field.mask] = field.fill_value
+        grid_obj.fields = {'reflectivity': {'data': field,
+                                            'units': 'dBZ'}}
+        grids.append(grid_obj)
+
+        # advance cells to the next scan
+        pos += vel
+        sigma *= 1 + growth
+        split = rng.rand(len(amp)) < split_rate
+        if split.any():
+            # children move apart perpendicular to their parent
+            across = np.column_stack([vel[split, 1], -vel[split, 0]])
+            across /= np.maximum(np.hypot(*across.T), 1e-9)[:, np.newaxis]
+            offset = across * sigma[split, np.newaxis]
+            sigma[split] /= np.sqrt(2)
+            pos = np.concatenate([pos, pos[split] - offset])
+            pos[np.flatnonzero(split)] += offset
+            vel = np.concatenate([vel, vel[split] - 0.2*across])
+            vel[np.flatnonzero(split)] += 0.2*across
+            amp = np.concatenate([amp, amp[split] - 2])
+            sigma = np.concatenate([sigma, sigma[split]])
+            top = np.concatenate([top, top[split]])
+        inside = ((pos[:, 0] > -4*sigma) & (pos[:, 0] < ny + 4*sigma)
+                  & (pos[:, 1] > -4*sigma) & (pos[:, 1] < nx + 4*sigma))
+        pos, vel, amp = pos[inside], vel[inside], amp[inside]
+        sigma, top = sigma[inside], top[inside]
+    return grids
+
+
+def draw_cell(data, center, sigma, amp, top, heights):
+    """ Draws one cell into data, keeping the maximum of overlapping cells.
+    Reflectivity falls off linearly above half the cell top. """
+    nz, ny, nx = data.shape
+    radius = int(np.ceil(4 * sigma))
+    row, col = int(round(center[0])), int(round(center[1]))
+    rows = slice(max(row - radius, 0), min(row + radius + 1, ny))
+    cols = slice(max(col - radius, 0), min(col + radius + 1, nx))
+    if rows.start >= rows.stop or cols.start >= cols.stop:
+        return
+    yy, xx = np.mgrid[rows, cols]
+    cell = amp * np.exp(-((yy - center[0])**2 + (xx - center[1])**2)
+                        / (2 * sigma**2))
+    profile = np.clip(2 * (1 - heights/top), 0, 1)
+    for level in np.flatnonzero(profile > 0):
+        window = data[level, rows, cols]
+        np.maximum(window, profile[level] * cell, out=window)
+
+
+def write_storm_files(path, nscans=3, shape=(10, 100, 100), ncells=10,
+                      **kwargs):
+    """ Writes grids of make_storm_grids to netCDF files in directory path,
+    with a second field, and returns list of their names. """
+    filenames = []
+    grids = make_storm_grids(nscans, shape, ncells, **kwargs)
+    for scan, grid_obj in enumerate(grids):
+        grid_obj.fields['velocity'] = {
+            'data': grid_obj.fields['reflectivity']['data'].copy()}
+        # not used by tracking, and not written by some netCDF4 versions
+        grid_obj.radar_name = None
+        filename = os.path.join(path, 'grid%03d.nc' % scan)
+        pyart.io.write_grid(filename, grid_obj)
+        filenames.append(filename)
+    return filenames
@@ -0,0 +1,83 @@
+""" Unit tests for cache module. """
+
+import glob
+import json
+import os
+
+import pyart
+
+from tint import Cell_tracks
+from tint.cache import ScanCache
+from tint.testing.synthetic import write_storm_files
+
+
+def test_scan_cache(tmpdir):
+    filenames = write_storm_files(str(tmpdir.mkdir('grids')))
+    tracks_obj = Cell_tracks(verbose=False)
+    tracks_obj.get_tracks(pyart.io.read_grid(filename)
+                          for filename in filenames)
+
+    cache_path = str(tmpdir.join('cache'))
+    read = []
+
+    def reader(filename):
+        read.append(filename)
+        return pyart.io.read_grid(filename)
+
+    cache = ScanCache(cache_path, reader=reader)
+    cached = Cell_tracks(verbose=False)
+    cached.get_tracks(filenames, cache=cache)
+    assert cache.misses == len(filenames)
+    assert cached.tracks.equals(tracks_obj.tracks)
+
+    # matching parameters are not part of the key
+    read = []
+    cache = ScanCache(cache_path, reader=reader)
+    cached = Cell_tracks(verbose=False)
+    cached.params['SEARCH_MARGIN'] = 2 * tracks_obj.params['SEARCH_MARGIN']
+    cached.get_tracks(filenames, cache=cache)
+    assert read == []
+    assert cache.hits == len(filenames)
+
+    cached = Cell_tracks(verbose=False)
+    cached.params['FIELD_THRESH'] = tracks_obj.params['FIELD_THRESH'] + 5
+    cached.get_tracks(filenames[:1], cache=cache)
+    assert read == filenames[:1]
+
+
+def test_scan_cache_evict(tmpdir):
+    filenames = write_storm_files(str(tmpdir.mkdir('grids')))
+    cache_path = str(tmpdir.join('cache'))
+    cache = ScanCache(cache_path)
+    Cell_tracks(verbose=False).get_tracks(filenames, cache=cache)
+    entries = glob.glob(os.path.join(cache_path, '*.pkl.gz'))
+    nbytes = sorted(os.path.getsize(entry) for entry in entries)
+    for entry in entries:
+        os.utime(entry, (1, 1))
+    # entries are ordered by modification time when the cache is opened
+    cache = ScanCache(cache_path, sum(nbytes[-2:]))
+    # first file is used most recently
+    cache.get_scan(filenames[0], 'reflectivity', Cell_tracks().params)
+    cache.evict()
+    assert len(glob.glob(os.path.join(cache_path, '*.pkl.gz'))) <= 2
+    hits = cache.hits
+    cache.get_scan(filenames[0], 'reflectivity', Cell_tracks().params)
+    assert cache.hits == hits + 1
+
+    # index entries of evicted products are dropped
+    cache.write_index()
+    with open(os.path.join(cache_path, 'index.json')) as f:
+        index = json.load(f)
+    entries = glob.glob(os.path.join(cache_path, '*.pkl.gz'))
+    assert len(index['entries']) == len(entries)
+    assert len(index['files']) == len(entries)
+    assert os.path.abspath(filenames[0]) in index['files']
+
+    # entries are evicted as they are put
+    max_bytes = sum(nbytes[-2:])
+    cache_path = str(tmpdir.join('small_cache'))
+    cache = ScanCache(cache_path, max_bytes)
+    Cell_tracks(verbose=False).get_tracks(filenames, cache=cache)
+    entries = glob.glob(os.path.join(cache_path, '*.pkl.gz'))
+    assert 0 < len(entries) < len(filenames)
+    assert sum(os.path.getsize(entry) for entry in entries) <= max_bytes
@@ -0,0 +1,68 @@
+""" Unit tests for chunks module. """
+
+from copy import deepcopy
+
+import numpy as np
+import pytest
+
+from tint import Cell_tracks
+from tint.chunks import track_chunks, get_chunk_bounds
+from tint.helpers import MetricsTable
+from tint.testing.sample_objects import grid, grid_shifted
+from tint.testing.synthetic import make_storm_grids
+
+
+def get_sample_grids():
+    grid_shifted2 = deepcopy(grid_shifted)
+    data = grid_shifted2.fields['reflectivity']['data']
+    grid_shifted2.fields['reflectivity']['data'] = np.ma.array(
+        np.roll(data.data, (10, 20), axis=(1, 2)))
+    grid_shifted2.time['units'] = 'seconds since 2015-07-10T18:46:00Z'
+    return [grid, grid_shifted, grid_shifted2]
+
+
+def test_get_chunk_bounds():
+    assert get_chunk_bounds(10, 3, 2) == [(0, 0, 3), (1, 3, 6), (4, 6, 10)]
+    assert len(get_chunk_bounds(2, 4, 1)) == 2
+
+
+def test_track_chunks():
+    grids = get_sample_grids()
+    expected = Cell_tracks()
+    expected.get_tracks(iter(deepcopy(grids)))
+    for nchunks, overlap in [(2, 1), (3, 0)]:
+        tracks_obj = track_chunks(deepcopy(grids), nchunks, overlap=overlap)
+        assert tracks_obj.tracks.equals(expected.tracks)
+        assert tracks_obj.counter.uid == expected.counter.uid
+        assert tracks_obj.grids_read == 3
+
+
+@pytest.mark.parametrize('nchunks, overlap, workers', [
+    (5, 1, None), (6, 2, None), (8, 1, None), (4, 0, None), (3, 3, 2)])
+def test_track_chunks_storms(nchunks, overlap, workers):
+    grids = make_storm_grids(14)
+    expected = Cell_tracks(verbose=False)
+    expected.get_tracks(iter(deepcopy(grids)))
+    rows = []
+    metrics = MetricsTable([lambda row: rows.append(row)])
+    tracks_obj = track_chunks(deepcopy(grids), nchunks, workers, overlap,
+                              tracker_kwargs={'verbose': False,
+                                              'metrics': metrics})
+    assert tracks_obj.tracks.equals(expected.tracks)
+    assert list(tracks_obj.metrics.to_frame().index) == list(range(14))
+    assert sorted(set(row['scan'] for row in rows)) == list(range(14))
+    assert tracks_obj.counter.uid == expected.counter.uid
+    assert tracks_obj.record.shifts.equals(expected.record.shifts)
+    assert (tracks_obj.record.correction_tally
+            == expected.record.correction_tally)
+    assert (tracks_obj.record.candidate_tally
+            == expected.record.candidate_tally)
+
+
+def test_track_chunks_trace_memory():
+    tracks_obj = track_chunks(deepcopy(get_sample_grids()), 2, overlap=1,
+                              tracker_kwargs={
+                                  'metrics': MetricsTable(trace_memory=True),
+                                  'verbose': False})
+    assert tracks_obj.metrics.trace_memory
+    assert (tracks_obj.metrics.to_frame()['extract_peak_bytes'] > 0).all()
@@ -0,0 +1,58 @@
+""" Unit tests for grid_io module. """
+
+import pickle
+
+import numpy as np
+import pyart
+import pytest
+
+from tint import Cell_tracks
+from tint.grid_io import prefetch_grids, read_grid
+from tint.testing.synthetic import write_storm_files
+
+
+def test_prefetch_grids():
+    assert list(prefetch_grids(iter(range(10)), size=3)) == list(range(10))
+    prefetched = prefetch_grids(['1', '2', '3'], reader=int)
+    assert [next(prefetched) for i in range(3)] == [1, 2, 3]
+    with pytest.raises(StopIteration):
+        next(prefetched)
+
+
+def test_prefetch_grids_processes():
+    prefetched = prefetch_grids(['1', '2', '3'], size=2, reader=int,
+                                processes=True)
+    assert list(prefetched) == [1, 2, 3]
+
+
+def test_prefetch_grids_error():
+    prefetched = prefetch_grids(['1', 'a'], reader=int)
+    assert next(prefetched) == 1
+    with pytest.raises(ValueError):
+        next(prefetched)
+
+
+def test_read_grid(tmpdir):
+    filename = write_storm_files(str(tmpdir), 1)[0]
+    grid_obj = read_grid(filename)
+    pyart_grid = pyart.io.read_grid(filename)
+    assert list(grid_obj.fields) == ['reflectivity']
+    data = grid_obj.fields['reflectivity']['data']
+    pyart_data = pyart_grid.fields['reflectivity']['data']
+    assert data.shape == pyart_data.shape
+    assert np.array_equal(data.data, pyart_data.data)
+    assert data.fill_value == pyart_data.fill_value
+    assert grid_obj.get_projparams() == pyart_grid.get_projparams()
+    grid_obj = pickle.loads(pickle.dumps(grid_obj))
+    assert np.array_equal(grid_obj.fields['reflectivity']['data'], data)
+
+
+def test_read_grid_tracks(tmpdir):
+    filenames = write_storm_files(str(tmpdir))
+    tracks_obj = Cell_tracks(verbose=False)
+    tracks_obj.get_tracks(read_grid(filename) for filename in filenames)
+    pyart_tracks = Cell_tracks(verbose=False)
+    pyart_tracks.get_tracks(pyart.io.read_grid(filename)
+                            for filename in filenames)
+    assert len(tracks_obj.tracks) > 0
+    assert tracks_obj.tracks.equals(pyart_tracks.tracks)
@@ -23,3 +23,15 @@ def test_extract_grid_data():
                                                  grid_size, params)
     assert np.max(filtered) == 11
     assert np.min(filtered) == 0
+
+
+def test_clear_small_echoes():
+    label_image = np.array([[1, 1, 0, 2],
+                            [1, 0, 0, 0],
+                            [0, 3, 3, 0],
+                            [4, 3, 3, 0]])
+    cleared = grid_utils.clear_small_echoes(label_image, 3)
+    assert np.all(cleared == np.array([[1, 1, 0, 0],
+                                       [1, 0, 0, 0],
+                                       [0, 2, 2, 0],
+                                       [0, 2, 2, 0]]))
@@ -0,0 +1,77 @@
+""" Unit tests for helpers module. """
+
+import numpy as np
+
+from tint.helpers import Record, Counter, TracksBuffer, MetricsTable
+from tint.testing.sample_objects import grid
+
+
+def test_tracks_buffer():
+    tracks_buffer = TracksBuffer()
+    for scan in range(20):
+        tracks_buffer.append({'scan': [scan, scan],
+                              'uid': [str(scan), str(scan + 100)],
+                              'area': [1.0, 2.0]})
+    assert tracks_buffer.nrows == 40
+    tracks_buffer.drop_scans(15)
+    tracks = tracks_buffer.to_frame()
+    assert len(tracks) == 30
+    assert tracks.index.names == ['scan', 'uid']
+    assert tracks.loc[(14, '114'), 'area'] == 2.0
+    assert np.all(tracks['area'].values[:2] == np.array([1.0, 2.0]))
+
+
+def test_record_shift_log():
+    full = Record(grid)
+    tally = Record(grid, shift_log='tally')
+    for record in [full, tally]:
+        record.count_case(4)
+        record.record_shift(np.array([1., 2.]), np.array([1., 1.]), None,
+                            np.array([1, 3]), 4)
+        record.add_uids({'uid': np.array(['0'])})
+        assert record.correction_tally['case4'] == 1
+    assert len(tally.shifts) == 0
+    assert full.shifts.loc[(-1, '0'), 'case'] == 4
+    assert np.all(np.isnan(full.shift_rows['last_heads'][0]))
+
+
+def test_record_snapshot():
+    record = Record(grid)
+    record.update_scan_and_time(grid)
+    record.record_shift(np.array([1., 2.]), np.array([1., 1.]), None,
+                        np.array([1, 3]), 4)
+    record.count_case(4)
+    snapshot = record.snapshot()
+    record.add_uids({'uid': np.array(['0'])})
+    record.update_scan_and_time(grid)
+    record.count_case(1)
+    record.restore(snapshot)
+    assert record.scan == 0
+    assert record.nshifts == 0 and record.nnew_shifts == 1
+    assert record.correction_tally['case1'] == 0
+    record.add_uids({'uid': np.array(['0'])})
+    assert record.shifts.loc[(0, '0'), 'case'] == 4
+
+
+def test_counter_snapshot():
+    counter = Counter()
+    counter.next_uid(2)
+    counter.next_cid('0')
+    snapshot = counter.snapshot()
+    counter.next_uid()
+    assert counter.next_cid('0') == '0b'
+    counter.next_cid('1')
+    counter.restore(snapshot)
+    assert counter.uid == 1
+    assert counter.cid == {'0': 0}
+
+
+def test_metrics_table():
+    rows = []
+    metrics = MetricsTable([rows.append])
+    for scan in range(3):
+        metrics.add({'scan': scan, 'objects': scan + 1})
+    metrics.drop_scans(2)
+    metrics.add({'scan': 2, 'objects': 4})
+    assert len(rows) == 4
+    assert list(metrics.to_frame()['objects']) == [1, 2, 4]
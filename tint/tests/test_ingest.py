@@ -0,0 +1,62 @@
+""" Unit tests for ingest module. """
+
+import pickle
+from copy import deepcopy
+
+import pytest
+
+from tint import Cell_tracks
+from tint.ingest import track_directory
+from tint.testing.sample_objects import grid, grid_shifted
+
+
+def read_pickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def write_grids(tmpdir):
+    # file names sort opposite to scan times
+    for name, grid_obj in [('a.pkl', grid_shifted), ('b.pkl', grid)]:
+        with open(str(tmpdir.join(name)), 'wb') as f:
+            pickle.dump(grid_obj, f)
+
+
+def test_track_directory(tmpdir):
+    write_grids(tmpdir)
+    rows = []
+    tracks_obj = Cell_tracks()
+    ingestor = track_directory(tracks_obj, str(tmpdir), '*.pkl',
+                               poll_interval=0.01, idle_timeout=0.05,
+                               reader=read_pickle,
+                               callback=lambda path, new_rows: rows.append(
+                                   new_rows))
+    assert ingestor.late == []
+    assert len(rows) == 2
+
+    expected = Cell_tracks()
+    expected.get_tracks(iter([deepcopy(grid), deepcopy(grid_shifted)]))
+    assert tracks_obj.tracks.equals(expected.tracks)
+
+
+def test_track_directory_late(tmpdir):
+    write_grids(tmpdir)
+    ingestor = track_directory(Cell_tracks(), str(tmpdir), '*.pkl',
+                               poll_interval=0.01, idle_timeout=0.05,
+                               reader=read_pickle, reorder_size=0)
+    assert ingestor.late == [str(tmpdir.join('b.pkl'))]
+
+
+def test_track_directory_reader_error(tmpdir):
+    write_grids(tmpdir)
+
+    def read_first(path):
+        if path.endswith('b.pkl'):
+            raise IOError('corrupt file')
+        return read_pickle(path)
+
+    tracks_obj = Cell_tracks()
+    with pytest.raises(IOError):
+        track_directory(tracks_obj, str(tmpdir), '*.pkl', poll_interval=0.01,
+                        idle_timeout=0.05, reader=read_first)
+    assert tracks_obj.grids_read == 1
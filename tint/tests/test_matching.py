@@ -11,3 +11,11 @@ def test_get_pairs():
     pairs = get_pairs(filtered, filtered_shifted, global_shift, None,
                       record, params)
     assert np.all(pairs == np.array([1, 2, 3, 5, 0, 6, 7, 8, 9, 10, 11]))
+
+
+def test_get_pairs_workers():
+    pairs = get_pairs(filtered, filtered_shifted, global_shift, None,
+                      record, params)
+    pairs_threaded = get_pairs(filtered, filtered_shifted, global_shift, None,
+                               record, params, workers=4)
+    assert np.all(pairs_threaded == pairs)
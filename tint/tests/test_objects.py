@@ -33,3 +33,29 @@ def test_init_current_objects():
             current_objects['id2'] == np.array([1, 2, 3, 5, 0, 6,
                                                 7, 8, 9, 10, 11])
             )
+
+
+def test_get_object_table():
+    obj_table = objects.get_object_table(filtered)
+    assert obj_table['nobj'] == np.max(filtered)
+    for obj in np.arange(obj_table['nobj']) + 1:
+        extent = objects.get_obj_extent(filtered, obj)
+        table_extent = objects.get_table_extent(obj_table, obj)
+        assert np.all(table_extent['obj_index'] == extent['obj_index'])
+        assert np.all(table_extent['obj_center'] == extent['obj_center'])
+        assert table_extent['obj_radius'] == extent['obj_radius']
+        assert table_extent['obj_area'] == extent['obj_area']
+
+
+def test_get_column_stats():
+    raw3D = np.zeros((3, 4, 4))
+    raw3D[:, 0, 0] = [40, 35, 10]
+    raw3D[:, 0, 1] = [20, 40, 50]
+    raw3D[:, 3, 3] = [45, 10, 10]
+    labeled = np.zeros((4, 4), dtype='i')
+    labeled[0, :2] = 1
+    labeled[3, 3] = 2
+    stats = objects.get_column_stats(raw3D, labeled, 32)
+    assert np.all(stats['field_max'] == np.array([50, 45]))
+    assert np.all(stats['top_index'] == np.array([2, 0]))
+    assert np.all(stats['voxels'] == np.array([4, 1]))
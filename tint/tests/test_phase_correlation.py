@@ -0,0 +1,34 @@
+""" Unit tests for phase_correlation module. """
+
+import numpy as np
+
+from tint.objects import get_object_table
+from tint.phase_correlation import FFTEngine, get_global_shift, get_spectrum
+from tint.phase_correlation import get_ambient_flows, get_bucket_length
+from tint.testing.sample_objects import raw, raw_shifted, params
+
+
+def test_get_global_shift_engines():
+    shift = get_global_shift(raw, raw_shifted, params)
+    for engine in [FFTEngine('rfft'), FFTEngine('scipy', workers=2)]:
+        fft1 = get_spectrum(raw, engine)
+        fft2 = get_spectrum(raw_shifted, engine)
+        engine_shift = get_global_shift(raw, raw_shifted, params, fft1, fft2,
+                                        engine)
+        assert np.all(engine_shift == shift)
+
+
+def test_get_bucket_length():
+    lengths = [get_bucket_length(n) for n in [1, 5, 7, 13, 33, 48, 49]]
+    assert lengths == [1, 6, 8, 16, 48, 48, 64]
+
+
+def test_get_ambient_flows():
+    image1 = np.zeros((100, 120), dtype='i')
+    image1[20:30, 30:38] = 1
+    image1[60:66, 80:90] = 2
+    image2 = np.roll(image1, (2, 3), axis=(0, 1))
+    obj_table = get_object_table(image1)
+    flows = get_ambient_flows(obj_table, image1, image2, params,
+                              np.array([500, 500, 500]))
+    assert np.all(flows == np.array([[2, 3], [2, 3]]))
@@ -0,0 +1,70 @@
+""" Unit tests for scheduler module. """
+
+from copy import deepcopy
+
+import pytest
+
+from tint import Cell_tracks
+from tint.helpers import MetricsTable
+from tint.scheduler import TrackingScheduler
+from tint.testing.sample_objects import grid, grid_shifted
+
+
+def test_tracking_scheduler():
+    expected = Cell_tracks()
+    expected.get_tracks(iter([deepcopy(grid), deepcopy(grid_shifted)]))
+
+    rows = []
+    scheduler = TrackingScheduler(workers=2, batch_size=1, tracker_kwargs={
+        'metrics': MetricsTable([lambda row: rows.append(row)])})
+    for site in ['KHGX', 'KLCH']:
+        scheduler.submit(site, deepcopy(grid))
+    scheduler.run()
+    for site in ['KHGX', 'KLCH']:
+        scheduler.submit(site, deepcopy(grid_shifted))
+    scheduler.run()
+
+    tracks = scheduler.tracks
+    assert tracks.index.names == ['site', 'scan', 'uid']
+    for site in ['KHGX', 'KLCH']:
+        assert tracks.loc[site].equals(expected.tracks)
+        assert scheduler.trackers[site].tracks_buffer.nrows == 0
+        shifts = scheduler.trackers[site].record.shifts
+        assert shifts.index.equals(expected.record.shifts.index)
+        assert len(scheduler.trackers[site].metrics.to_frame()) == 2
+    # the first scan of each site is added again when it is linked
+    assert len(rows) == 6
+
+
+def read_grid(grid_obj):
+    if grid_obj is None:
+        raise IOError('missing grid')
+    return grid_obj
+
+
+def test_tracking_scheduler_error():
+    expected = Cell_tracks()
+    expected.get_tracks(iter([deepcopy(grid), deepcopy(grid_shifted)]))
+
+    scheduler = TrackingScheduler(reader=read_grid, batch_size=1)
+    scheduler.submit('KHGX', deepcopy(grid))
+    scheduler.submit('KHGX', None)
+    with pytest.raises(IOError):
+        scheduler.run()
+    assert list(scheduler.queues['KHGX']) == [None]
+    assert scheduler.trackers['KHGX'].grids_read == 1
+    scheduler.queues['KHGX'][0] = deepcopy(grid_shifted)
+    scheduler.run()
+    assert scheduler.errors == {}
+    assert scheduler.tracks.loc['KHGX'].equals(expected.tracks)
+
+
+def test_tracking_scheduler_trace_memory():
+    scheduler = TrackingScheduler(tracker_kwargs={
+        'metrics': MetricsTable(trace_memory=True), 'verbose': False})
+    scheduler.submit('KHGX', deepcopy(grid))
+    scheduler.submit('KHGX', deepcopy(grid_shifted))
+    scheduler.run()
+    metrics = scheduler.trackers['KHGX'].metrics
+    assert metrics.trace_memory
+    assert (metrics.to_frame()['extract_peak_bytes'] > 0).all()
@@ -0,0 +1,56 @@
+""" Unit tests for sinks module. """
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from tint.sinks import ParquetSink
+
+
+def append_scans(sink, scans):
+    for scan in scans:
+        sink.append({'scan': [scan, scan],
+                     'uid': [str(scan), str(scan + 100)],
+                     'area': [1.0, 2.0]})
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'arrow'])
+def test_parquet_sink(tmpdir, file_format):
+    sink = ParquetSink(str(tmpdir), row_group_size=6, file_format=file_format)
+    append_scans(sink, range(10))
+    assert len(sink.get_files()) == 4
+    assert sink.nrows == 4
+    sink.drop_scans(9)
+    append_scans(sink, [9])
+    tracks = sink.to_frame()
+    assert len(tracks) == 20
+    assert tracks.index.names == ['scan', 'uid']
+    assert np.all(tracks.index.get_level_values('scan') == np.repeat(range(10),
+                                                                      2))
+
+
+def test_parquet_sink_close(tmpdir):
+    sink = ParquetSink(str(tmpdir), row_group_size=100)
+    append_scans(sink, range(3))
+    sink.close()
+    assert sink.nrows == 0
+    sink.drop_scans(2)
+    append_scans(sink, [2, 3])
+    assert len(sink.to_frame()) == 8
+
+
+def test_parquet_sink_mode(tmpdir):
+    sink = ParquetSink(str(tmpdir))
+    append_scans(sink, range(3))
+    sink.close()
+    with pytest.raises(ValueError):
+        ParquetSink(str(tmpdir))
+    appended = ParquetSink(str(tmpdir), mode='append')
+    append_scans(appended, [3])
+    appended.close()
+    assert len(appended.to_frame()) == 8
+    overwritten = ParquetSink(str(tmpdir), mode='overwrite')
+    assert len(overwritten.get_files()) == 0
+    append_scans(overwritten, [0])
+    assert len(overwritten.to_frame()) == 2
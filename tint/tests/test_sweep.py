@@ -0,0 +1,55 @@
+""" Unit tests for sweep module. """
+
+from copy import deepcopy
+
+import pyart
+import pytest
+
+from tint import Cell_tracks
+from tint.cache import ScanCache
+from tint.helpers import MetricsTable
+from tint.sweep import sweep, get_param_groups
+from tint.testing.synthetic import make_storm_grids, write_storm_files
+
+
+def test_get_param_groups():
+    param_sets = [{'A': 1, 'B': 1}, {'A': 2, 'B': 1}, {'A': 1, 'B': 2}]
+    assert get_param_groups(param_sets, ['A']) == {(1,): [0, 2], (2,): [1]}
+
+
+def test_sweep():
+    grids = make_storm_grids(nscans=4, shape=(5, 80, 80), ncells=8)
+    param_sets = [{}, {'SEARCH_MARGIN': 8000, 'MAX_DISPARITY': 50},
+                  {'FIELD_THRESH': 36}, {'GS_ALT': 1000}]
+    sweep_tracks = sweep(deepcopy(grids), param_sets, workers=2)
+    for params, tracks in zip(param_sets, sweep_tracks):
+        tracks_obj = Cell_tracks(verbose=False)
+        tracks_obj.params.update(params)
+        tracks_obj.get_tracks(iter(deepcopy(grids)))
+        assert tracks.equals(tracks_obj.tracks)
+    streamed_tracks = sweep(iter(deepcopy(grids)), param_sets)
+    for tracks, streamed in zip(sweep_tracks, streamed_tracks):
+        assert streamed.equals(tracks)
+
+    with pytest.raises(ValueError):
+        sweep(grids, [{'SEARCH_RADIUS': 8000}])
+    with pytest.raises(ValueError):
+        sweep(grids, param_sets, tracker_kwargs={'metrics': MetricsTable()})
+
+
+def test_sweep_cache(tmpdir):
+    filenames = write_storm_files(str(tmpdir.mkdir('grids')))
+    read = []
+
+    def reader(filename):
+        read.append(filename)
+        return pyart.io.read_grid(filename)
+
+    param_sets = [{}, {'FIELD_THRESH': 36}, {'MAX_DISPARITY': 50}]
+    cache = ScanCache(str(tmpdir.join('cache')), reader=reader)
+    cached_tracks = sweep(filenames, param_sets, cache=cache)
+    assert read == filenames
+    assert cache.misses == 2 * len(filenames)
+    read_tracks = sweep(filenames, param_sets, reader=pyart.io.read_grid)
+    for cached, tracks in zip(cached_tracks, read_tracks):
+        assert cached.equals(tracks)
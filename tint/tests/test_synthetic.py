@@ -0,0 +1,20 @@
+""" Unit tests for synthetic module. """
+
+import numpy as np
+
+from tint import Cell_tracks
+from tint.grid_utils import parse_grid_datetime
+from tint.testing.synthetic import make_storm_grids
+
+
+def test_make_storm_grids():
+    grids = make_storm_grids(nscans=4, shape=(5, 60, 80), ncells=5,
+                             split_rate=0.5)
+    assert len(grids) == 4
+    assert grids[0].fields['reflectivity']['data'].shape == (5, 60, 80)
+    times = [parse_grid_datetime(grid_obj) for grid_obj in grids]
+    assert all(np.diff(times).astype('timedelta64[s]').astype(int) == 300)
+
+    tracks_obj = Cell_tracks()
+    tracks_obj.get_tracks(iter(grids))
+    assert len(tracks_obj.tracks) > 0
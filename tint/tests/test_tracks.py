@@ -0,0 +1,128 @@
+""" Unit tests for tracks module. """
+
+import tracemalloc
+from copy import deepcopy
+
+import numpy as np
+
+from tint import Cell_tracks
+from tint.grid_io import read_grid
+from tint.helpers import MetricsTable
+from tint.testing.sample_objects import grid, grid_shifted
+from tint.testing.synthetic import write_storm_files
+
+
+def get_sample_tracks(**kwargs):
+    tracks_obj = Cell_tracks(**kwargs)
+    tracks_obj.get_tracks(iter([deepcopy(grid), deepcopy(grid_shifted)]))
+    return tracks_obj
+
+
+def test_get_tracks_preprocess_workers():
+    serial = get_sample_tracks()
+    pipelined = get_sample_tracks(preprocess_workers=2)
+    assert serial.tracks.equals(pipelined.tracks)
+
+
+def test_get_tracks_reader(tmpdir):
+    filenames = write_storm_files(str(tmpdir), nscans=4)
+    expected = Cell_tracks(verbose=False)
+    expected.get_tracks(read_grid(filename) for filename in filenames)
+    for workers in [None, 2]:
+        tracks_obj = Cell_tracks(preprocess_workers=workers, verbose=False)
+        tracks_obj.get_tracks(filenames[:2], reader=read_grid)
+        tracks_obj.get_tracks(filenames[2:], reader=read_grid)
+        assert tracks_obj.tracks.equals(expected.tracks)
+
+
+def test_get_tracks_update():
+    tracks_obj = Cell_tracks()
+    tracks_obj.get_tracks(iter([deepcopy(grid)]))
+    tracks_obj.get_tracks(iter([deepcopy(grid_shifted)]))
+    assert not tracks_obj.tracks.index.duplicated().any()
+    assert tracks_obj.tracks.equals(get_sample_tracks().tracks)
+
+
+def test_set_tracks():
+    tracks_obj = get_sample_tracks()
+    tracks = tracks_obj.tracks.copy()
+    tracks_obj.tracks = tracks[tracks['area'] > 0]
+    assert tracks_obj.tracks.equals(tracks[tracks['area'] > 0])
+    tracks_obj.get_tracks(iter([deepcopy(grid_shifted)]))
+    assert len(tracks_obj.tracks) > 0
+    assert not tracks_obj.tracks.index.duplicated().any()
+    tracks_obj.tracks = tracks
+    assert tracks_obj.tracks.equals(tracks)
+
+
+def test_checkpoint_resume(tmpdir):
+    path = str(tmpdir.join('tracks.ckpt'))
+    tracks_obj = Cell_tracks()
+    tracks_obj.get_tracks(iter([deepcopy(grid), deepcopy(grid_shifted)]),
+                          checkpoint_path=path, checkpoint_every=1)
+    resumed = Cell_tracks.load_checkpoint(path)
+    assert resumed.grids_read == 2
+    assert resumed.last_scan['grid'] is None
+    resumed.get_tracks(iter([]))
+    assert resumed.tracks.equals(tracks_obj.tracks)
+
+
+def test_checkpoint_metrics_hooks(tmpdir):
+    path = str(tmpdir.join('tracks.ckpt'))
+    rows = []
+    tracks_obj = Cell_tracks(metrics=MetricsTable([lambda row: None]))
+    tracks_obj.get_tracks(iter([deepcopy(grid), deepcopy(grid_shifted)]),
+                          checkpoint_path=path, checkpoint_every=1)
+    assert not tmpdir.join('tracks.ckpt.tmp').check()
+    resumed = Cell_tracks.load_checkpoint(path, [lambda row: rows.append(row)])
+    resumed.get_tracks(iter([]))
+    assert len(rows) == 1
+    assert resumed.metrics.to_frame().index.equals(
+        tracks_obj.metrics.to_frame().index)
+
+
+def test_push():
+    tracks_obj = Cell_tracks()
+    first_rows = tracks_obj.push(deepcopy(grid))
+    new_rows = tracks_obj.push(deepcopy(grid_shifted))
+    assert tracks_obj.last_scan['grid'] is None
+    assert set(new_rows.index.get_level_values('scan')) == {0, 1}
+    assert len(first_rows) == len(new_rows.loc[0])
+    assert tracks_obj.tracks.equals(get_sample_tracks().tracks)
+
+
+def test_metrics():
+    rows = []
+    tracks_obj = get_sample_tracks(metrics=MetricsTable([rows.append]),
+                                   verbose=False)
+    metrics = tracks_obj.metrics.to_frame()
+    assert list(metrics.index) == [0, 1]
+    assert len(rows) == 2
+    nobj = tracks_obj.tracks.groupby('scan').size()
+    assert (metrics['objects'] == nobj).all()
+    assert metrics['candidates'].sum() == tracks_obj.record.candidate_tally
+    assert (metrics['match_seconds'] > 0).all()
+    assert tracks_obj.tracks.equals(get_sample_tracks().tracks)
+
+
+def test_metrics_trace_memory():
+    tracks_obj = get_sample_tracks(metrics=MetricsTable(trace_memory=True),
+                                   verbose=False)
+    metrics = tracks_obj.metrics.to_frame()
+    assert (metrics['extract_peak_bytes'] > 0).all()
+    assert (metrics['props_peak_bytes'] > 0).all()
+    assert not tracemalloc.is_tracing()
+
+
+def test_metrics_outer_tracing():
+    tracemalloc.start()
+    try:
+        data = np.ones(10**7)
+        del data
+        peak = tracemalloc.get_traced_memory()[1]
+        for metrics in [None, MetricsTable(trace_memory=True)]:
+            get_sample_tracks(metrics=metrics, verbose=False)
+            assert tracemalloc.is_tracing()
+            assert tracemalloc.get_traced_memory()[1] >= peak
+    finally:
+        tracemalloc.stop()
@@ -8,16 +8,23 @@ Cell_tracks class.
 
 import copy
 import datetime
+import gzip
+import itertools
+import os
+import pickle
 
 import numpy as np
-import pandas as pd
 
-from .grid_utils import get_grid_size, get_radar_info, extract_grid_data
-from .helpers import Record, Counter
-from .phase_correlation import get_global_shift
+from .grid_utils import get_grid_size, get_radar_info
+from .helpers import Record, Counter, TracksBuffer, MetricsTable, grow_rows
+from .helpers import get_scan_products, iter_scan_products
+from .helpers import get_empty_products, start_stage, end_stage
+from .helpers import start_tracing, stop_tracing
+from .helpers import get_checkpoint_products, restore_products
+from .phase_correlation import get_global_shift, FFTEngine
 from .matching import get_pairs
 from .objects import init_current_objects, update_current_objects
-from .objects import get_object_prop, write_tracks
+from .objects import get_object_prop, get_track_columns, same_objects
 
 # Tracking Parameter Defaults
 FIELD_THRESH = 32
@@ -80,9 +87,12 @@ class Cell_tracks(object):
         'reflectivity'.
     grid_size : array
         Array containing z, y, and x mesh size in meters respectively.
-    last_grid : Grid
-        Contains the most recent grid object tracked. This is used for dynamic
-        updates.
+    last_scan : dict
+        Products of the most recent scan tracked, without its grid. See
+        get_scan_products in tint.helpers. This is used for dynamic updates.
+    grids_read : int
+        Number of grids read by get_tracks since the first scan. A run resumed
+        from a checkpoint continues with the grids after the first grids_read.
     counter : Counter
         See Counter class.
     record : Record
@@ -90,18 +100,45 @@ class Cell_tracks(object):
     current_objects : dict
         Contains information about objects in the current scan.
     tracks : DataFrame
+        Properties of all tracked objects, indexed by scan and uid. Built from
+        tracks_buffer when read, and copied into it when set.
+    tracks_buffer : TracksBuffer
+        Columns of the tracks table, appended to once per scan. This is the
+        sink given to get_tracks, if any.
+    fft_engine : FFTEngine
+        Computes the spectra used for the global shift. See FFTEngine in
+        tint.phase_correlation for the available backends.
+    match_workers : int
+        Number of threads used to match objects between scans. None or 1
+        matches objects serially. See locate_all_objects in tint.matching.
+    preprocess_workers : int
+        Number of processes used to extract upcoming scans and their object
+        properties while the current scan is matched. None or 1 preprocesses
+        scans in the tracking loop. See iter_scan_products in tint.helpers.
+    shift_log : str
+        Level of shift correction bookkeeping in record: 'off', 'tally' or
+        'full'. See Record.
+    metrics : MetricsTable
+        If given, a row of stage times and counts is added for each scan
+        tracked. Candidate and correction counts need shift_log other than
+        'off'. None disables instrumentation.
+    verbose : bool
+        Print progress of each scan if True.
 
-    __saved_record : Record
-        Deep copy of Record at the penultimate scan in the sequence. This and
+    __saved_record : dict
+        Snapshot of record at the penultimate scan in the sequence. This and
         following 2 attributes used for link-up in dynamic updates.
-    __saved_counter : Counter
-        Deep copy of Counter.
+    __saved_counter : dict
+        Snapshot of counter.
     __saved_objects : dict
-        Deep copy of current_objects.
+        current_objects at the penultimate scan. It is replaced rather than
+        modified by the tracking loop, so it is not copied.
 
     """
 
-    def __init__(self, field='reflectivity'):
+    def __init__(self, field='reflectivity', fft_engine=None,
+                 match_workers=None, preprocess_workers=None,
+                 shift_log='full', metrics=None, verbose=True):
         self.params = {'FIELD_THRESH': FIELD_THRESH,
                        'MIN_SIZE': MIN_SIZE,
                        'SEARCH_MARGIN': SEARCH_MARGIN,
@@ -116,124 +153,504 @@ class Cell_tracks(object):
         self.field = field
         self.grid_size = None
         self.radar_info = None
-        self.last_grid = None
+        self.last_scan = None
+        self.grids_read = 0
         self.counter = None
         self.record = None
         self.current_objects = None
-        self.tracks = pd.DataFrame()
+        self.tracks_buffer = TracksBuffer()
+        self.__tracks = None
+        if fft_engine is None:
+            fft_engine = FFTEngine()
+        self.fft_engine = fft_engine
+        self.match_workers = match_workers
+        self.preprocess_workers = preprocess_workers
+        self.shift_log = shift_log
+        self.metrics = metrics
+        self.verbose = verbose
 
         self.__saved_record = None
         self.__saved_counter = None
         self.__saved_objects = None
 
+    @property
+    def tracks(self):
+        """ Tracks DataFrame. It is rebuilt from tracks_buffer only when new
+        scans have been written since it was last read. """
+        if self.__tracks is None:
+            self.__tracks = self.tracks_buffer.to_frame()
+        return self.__tracks
+
+    @tracks.setter
+    def tracks(self, tracks):
+        """ Replaces the tracks with a DataFrame indexed by scan and uid,
+        e.g. tracks edited or read from a file. Its rows are copied into a
+        new in-memory tracks_buffer, which also replaces any sink. """
+        self.tracks_buffer = TracksBuffer()
+        if len(tracks) > 0:
+            columns = tracks.reset_index()
+            self.tracks_buffer.append(dict(
+                (name, columns[name].values) for name in columns.columns))
+        self.__tracks = None
+
     def __save(self):
-        """ Saves deep copies of record, counter, and current_objects. """
-        self.__saved_record = copy.deepcopy(self.record)
-        self.__saved_counter = copy.deepcopy(self.counter)
-        self.__saved_objects = copy.deepcopy(self.current_objects)
+        """ Saves snapshots of record, counter, and current_objects. Their
+        cost depends only on the current scan, not on the length of the
+        tracks. """
+        self.__saved_record = self.record.snapshot()
+        self.__saved_counter = self.counter.snapshot()
+        self.__saved_objects = self.current_objects
 
     def __load(self):
-        """ Loads saved copies of record, counter, and current_objects. If new
+        """ Restores saved record, counter, and current_objects. If new
         tracks are appended to existing tracks via the get_tracks method, the
         most recent scan prior to the addition must be overwritten to link up
         with the new scans. Because of this, record, counter and
         current_objects must be reverted to their state in the penultimate
         iteration of the loop in get_tracks. See get_tracks for details. """
-        self.record = self.__saved_record
-        self.counter = self.__saved_counter
+        self.record.restore(self.__saved_record)
+        self.counter.restore(self.__saved_counter)
         self.current_objects = self.__saved_objects
 
-    def get_tracks(self, grids):
+    def save_checkpoint(self, path):
+        """ Writes the tracking state to a compressed pickle at path, from
+        which tracking can be resumed with load_checkpoint. Of the most recent
+        scan only the arrays needed for linking are stored, not its grid.
+        Rows held in memory by tracks_buffer and the shift records of record
+        are stored in full, so with the default TracksBuffer each checkpoint
+        grows with the number of scans tracked. For long checkpointed runs,
+        pass a ParquetSink from tint.sinks to get_tracks, whose finished rows
+        are on disk, and shift_log 'tally' or 'off'. Metrics rows are stored
+        without their hooks, see load_checkpoint. """
+        last_scan = self.last_scan
+        if last_scan['nobj'] > 0 and last_scan['obj_props'] is None:
+            last_scan['obj_props'] = get_object_prop(
+                last_scan['frame'], last_scan['grid'], self.field, self.record,
+                self.params, last_scan['obj_table'])
+        metrics = self.metrics
+        if metrics is not None:
+            # hooks are often lambdas or clients, which cannot be pickled
+            metrics = copy.copy(metrics)
+            metrics.hooks = []
+        state = {'params': self.params,
+                 'field': self.field,
+                 'grid_size': self.grid_size,
+                 'radar_info': self.radar_info,
+                 'counter': self.counter,
+                 'record': self.record,
+                 'current_objects': self.current_objects,
+                 'last_scan': get_checkpoint_products(last_scan),
+                 'grids_read': self.grids_read,
+                 'tracks_buffer': self.tracks_buffer,
+                 'fft_engine': self.fft_engine,
+                 'match_workers': self.match_workers,
+                 'preprocess_workers': self.preprocess_workers,
+                 'shift_log': self.shift_log,
+                 'metrics': metrics,
+                 'verbose': self.verbose}
+        # write to a temporary name so a preempted write never replaces the
+        # previous checkpoint
+        tmp_path = path + '.tmp'
+        try:
+            with gzip.open(tmp_path, 'wb', compresslevel=1) as f:
+                pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load_checkpoint(cls, path, hooks=None):
+        """ Returns Cell_tracks object restored from a checkpoint written by
+        save_checkpoint. Pass the grids after the first grids_read to
+        get_tracks to continue tracking. Metrics hooks are not saved in
+        checkpoints; hooks, if given, are attached to the restored
+        metrics. """
+        with gzip.open(path, 'rb') as f:
+            state = pickle.load(f)
+        tracks_obj = cls(state['field'], state['fft_engine'],
+                         state['match_workers'], state['preprocess_workers'],
+                         state['shift_log'], state['metrics'],
+                         state['verbose'])
+        for name in ('params', 'grid_size', 'radar_info', 'counter', 'record',
+                     'current_objects', 'grids_read', 'tracks_buffer'):
+            setattr(tracks_obj, name, state[name])
+        tracks_obj.last_scan = restore_products(state['last_scan'],
+                                                tracks_obj.fft_engine)
+        if hooks is not None and tracks_obj.metrics is not None:
+            tracks_obj.metrics.hooks = hooks
+        # rows written to disk after the checkpoint are written again
+        tracks_obj.tracks_buffer.rollback()
+        return tracks_obj
+
+    def __start(self, grid_size, radar_info):
+        """ Initializes the tracking state given the grid size and radar
+        location of the first grid. """
+        self.grid_size = grid_size
+        self.radar_info = radar_info
+        self.counter = Counter()
+        self.record = Record(None, self.shift_log, grid_size)
+
+    def __drop_scans(self, first_scan):
+        """ Drops tracks and metrics of first_scan and all later scans. """
+        self.tracks_buffer.drop_scans(first_scan)
+        if self.metrics is not None:
+            self.metrics.drop_scans(first_scan)
+        self.__tracks = None
+
+    def __link_scans(self, scan1, scan2):
+        """ Matches the objects of scan1 to those of scan2 and writes the
+        tracks of scan1. Returns the columns written, or None if scan1 is
+        empty. scan2 is empty when the last scan of a sequence is written. """
+        self.record.update_scan(scan1['time'], scan2['time'])
+
+        if scan1['nobj'] == 0:
+            if self.verbose:
+                print('No cells found in scan', self.record.scan)
+            self.current_objects = None
+            if self.metrics is not None:
+                self.__add_metrics(scan1, None, {}, {})
+            return None
+
+        if self.metrics is not None:
+            tally = (self.record.candidate_tally,
+                     dict(self.record.correction_tally))
+        seconds = {}
+        peak_bytes = {}
+        start = start_stage()
+        if 'global_shift' in scan1:
+            global_shift = scan1['global_shift']
+        else:
+            global_shift = get_global_shift(scan1['raw'],
+                                            scan2['raw'],
+                                            self.params,
+                                            scan1['spectrum'],
+                                            scan2['spectrum'],
+                                            self.fft_engine)
+        end_stage(start, 'shift', seconds, peak_bytes)
+        start = start_stage()
+        pairs = get_pairs(scan1['frame'],
+                          scan2['frame'],
+                          global_shift,
+                          self.current_objects,
+                          self.record,
+                          self.params,
+                          scan1['obj_table'],
+                          scan2['obj_table'],
+                          self.fft_engine,
+                          self.match_workers)
+        if self.current_objects is None:
+            # first nonempty scan after a period of empty scans
+            self.current_objects, self.counter = init_current_objects(
+                scan1['frame'],
+                scan2['frame'],
+                pairs,
+                self.counter,
+                scan1['obj_table'],
+                scan2['obj_table']
+            )
+        else:
+            self.current_objects, self.counter = update_current_objects(
+                scan1['frame'],
+                scan2['frame'],
+                pairs,
+                self.current_objects,
+                self.counter,
+                scan1['obj_table'],
+                scan2['obj_table']
+            )
+        end_stage(start, 'match', seconds, peak_bytes)
+
+        if scan1['obj_props'] is None:
+            start = start_stage()
+            scan1['obj_props'] = get_object_prop(
+                scan1['frame'], scan1['grid'], self.field, self.record,
+                self.params, scan1['obj_table'])
+            # kept with the scan, as the row may be written again
+            end_stage(start, 'props', scan1['seconds'], scan1['peak_bytes'])
+        self.record.add_uids(self.current_objects)
+        if self.verbose:
+            print('Writing tracks for scan', self.record.scan)
+        start = start_stage()
+        columns = get_track_columns(self.record, self.current_objects,
+                                    scan1['obj_props'])
+        self.tracks_buffer.append(columns)
+        self.__tracks = None
+        end_stage(start, 'write', seconds, peak_bytes)
+        if self.metrics is not None:
+            self.__add_metrics(scan1, pairs, seconds, peak_bytes, tally)
+        return columns
+
+    def __add_metrics(self, scan1, pairs, seconds, peak_bytes, tally=None):
+        """ Adds the metrics row of the scan just written. Stages run once
+        per scan, extraction and object properties, are kept with the scan
+        products, those of linking are given. """
+        seconds = dict(scan1['seconds'], **seconds)
+        peak_bytes = dict(scan1['peak_bytes'], **peak_bytes)
+        row = {'scan': self.record.scan,
+               'time': scan1['time'],
+               'objects': scan1['nobj'],
+               'matched': 0,
+               'new': 0,
+               'candidates': 0}
+        for case in self.record.correction_tally:
+            row[case] = 0
+        if pairs is not None:
+            row['matched'] = int(np.sum(np.asarray(pairs) > 0))
+            row['new'] = int(np.sum(self.current_objects['obs_num'] == 0))
+            candidates, cases = tally
+            row['candidates'] = self.record.candidate_tally - candidates
+            for case, count in self.record.correction_tally.items():
+                row[case] = count - cases[case]
+        for stage in ('extract', 'shift', 'match', 'props', 'write'):
+            row[stage + '_seconds'] = seconds.get(stage, 0.0)
+        if self.metrics.trace_memory:
+            for stage in ('extract', 'shift', 'match', 'props', 'write'):
+                row[stage + '_peak_bytes'] = peak_bytes.get(stage, 0)
+        self.metrics.add(row)
+
+    def __start_tracing(self):
+        """ Starts tracemalloc if metrics trace memory and it is not
+        already tracing. Returns True if tracing was started. See
+        start_tracing in tint.helpers. """
+        if self.metrics is None or not self.metrics.trace_memory:
+            return False
+        return start_tracing()
+
+    def get_tracks(self, grids, sink=None, checkpoint_path=None,
+                   checkpoint_every=10, cache=None, reader=None):
         """ Obtains tracks given a list of pyart grid objects. This is the
         primary method of the tracks class. This method makes use of all of the
-        functions and helper classes defined above. """
-        start_time = datetime.datetime.now()
+        functions and helper classes defined above. If a sink such as
+        ParquetSink from tint.sinks is given, tracks are written to it as
+        they are obtained and the tracks attribute reads from it. If
+        checkpoint_path is given, the tracking state is saved there every
+        checkpoint_every scans. See save_checkpoint. If cache, a ScanCache
+        from tint.cache, is given, grids are file names, and the products of
+        files already in the cache are read from it instead of the files. If
+        reader, e.g. pyart.io.read_grid, is given, grids are file names read
+        with it, by the worker processes if preprocess_workers is greater than
+        1, see iter_scan_products in tint.helpers. """
+        if sink is not None and sink is not self.tracks_buffer:
+            if self.tracks_buffer.nrows > 0:
+                sink.append(self.tracks_buffer.get_columns())
+            self.tracks_buffer = sink
+            self.__tracks = None
 
-        if self.record is None:
-            # tracks object being initialized
-            grid_obj2 = next(grids)
-            self.grid_size = get_grid_size(grid_obj2)
-            self.radar_info = get_radar_info(grid_obj2)
-            self.counter = Counter()
-            self.record = Record(grid_obj2)
+        grids = iter(grids)
+        if self.record is None and cache is None and reader is None:
+            grid_obj = next(grids)
+            self.__start(get_grid_size(grid_obj), get_radar_info(grid_obj))
+            grids = itertools.chain([grid_obj], grids)
+        if cache is None:
+            scans = iter_scan_products(grids, self.field, self.grid_size,
+                                       self.params, self.fft_engine,
+                                       self.preprocess_workers, reader)
         else:
-            # tracks object being updated
-            grid_obj2 = self.last_grid
-            self.tracks.drop(self.record.scan + 1)  # last scan is overwritten
+            scans = cache.iter_scans(grids, self.field, self.params,
+                                     self.fft_engine)
+        self.track_scans(scans, checkpoint_path, checkpoint_every)
 
-        if self.current_objects is None:
-            newRain = True
+    def track_scans(self, scans, checkpoint_path=None, checkpoint_every=10):
+        """ Same as get_tracks, given an iterator of the products of each
+        scan rather than grids, see get_scan_products in tint.helpers. The
+        first scan of a new tracks object must also hold the grid_size and
+        radar_info of its grid, like those of ScanCache in tint.cache. If a
+        scan holds the global_shift to the next scan, it is not computed
+        again, see tint.sweep. """
+        start_time = datetime.datetime.now()
+        tracing = self.__start_tracing()
+        scans = iter(scans)
+        if self.last_scan is None:
+            # tracks object being initialized
+            scan2 = next(scans)
+            if self.record is None:
+                self.__start(scan2['grid_size'], scan2['radar_info'])
+            self.grids_read += 1
         else:
-            newRain = False
+            # tracks object being updated
+            scan2 = self.last_scan
+            # last scan is overwritten
+            self.__drop_scans(self.record.scan + 1)
 
-        raw2, frame2 = extract_grid_data(grid_obj2, self.field, self.grid_size,
-                                         self.params)
+        nscans = 0
+        while scan2['time'] is not None:
+            if (checkpoint_path is not None and nscans > 0
+                    and nscans % checkpoint_every == 0):
+                # frame2 is the scan a resumed run starts from
+                self.last_scan = scan2
+                self.save_checkpoint(checkpoint_path)
+            nscans += 1
 
-        while grid_obj2 is not None:
-            grid_obj1 = grid_obj2
-            raw1 = raw2
-            frame1 = frame2
+            # products of frame2 are carried forward as those of frame1
+            scan1 = scan2
 
             try:
-                grid_obj2 = next(grids)
+                scan2 = next(scans)
+                self.grids_read += 1
             except StopIteration:
-                grid_obj2 = None
-
-            if grid_obj2 is not None:
-                self.record.update_scan_and_time(grid_obj1, grid_obj2)
-                raw2, frame2 = extract_grid_data(grid_obj2,
-                                                 self.field,
-                                                 self.grid_size,
-                                                 self.params)
-            else:
+                scan2 = None
+
+            if scan2 is None:
                 # setup to write final scan
                 self.__save()
-                self.last_grid = grid_obj1
-                self.record.update_scan_and_time(grid_obj1)
-                raw2 = None
-                frame2 = np.zeros_like(frame1)
+                self.last_scan = scan1
+                scan2 = get_empty_products(scan1)
 
-            if np.max(frame1) == 0:
-                newRain = True
-                print('No cells found in scan', self.record.scan)
-                self.current_objects = None
-                continue
-
-            global_shift = get_global_shift(raw1, raw2, self.params)
-            pairs = get_pairs(frame1,
-                              frame2,
-                              global_shift,
-                              self.current_objects,
-                              self.record,
-                              self.params)
-
-            if newRain:
-                # first nonempty scan after a period of empty scans
-                self.current_objects, self.counter = init_current_objects(
-                    frame1,
-                    frame2,
-                    pairs,
-                    self.counter
-                )
-                newRain = False
-            else:
-                self.current_objects, self.counter = update_current_objects(
-                    frame1,
-                    frame2,
-                    pairs,
-                    self.current_objects,
-                    self.counter
-                )
-
-            obj_props = get_object_prop(frame1, grid_obj1, self.field,
-                                        self.record, self.params)
-            self.record.add_uids(self.current_objects)
-            self.tracks = write_tracks(self.tracks, self.record,
-                                       self.current_objects, obj_props)
-            del grid_obj1, raw1, frame1, global_shift, pairs, obj_props
+            self.__link_scans(scan1, scan2)
+            del scan1
             # scan loop end
+        # the grid is not kept, the products are enough to link up
+        self.last_scan['grid'] = None
+        # the next scan of an update is not the one of a given global shift
+        self.last_scan.pop('global_shift', None)
         self.__load()
+        if tracing:
+            stop_tracing()
         time_elapsed = datetime.datetime.now() - start_time
-        print('\n')
-        print('time elapsed', np.round(time_elapsed.seconds/60, 1), 'minutes')
+        if self.verbose:
+            print('\n')
+            print('time elapsed', np.round(time_elapsed.seconds/60, 1),
+                  'minutes')
         return
+
+    def push(self, grid_obj):
+        """ Tracks a single new grid, for live feeds where grids arrive one at
+        a time. Returns a DataFrame of the rows written by this call: the
+        final rows of the previous scan, now linked to grid_obj, and the rows
+        of the scan of grid_obj, which are replaced by the next push. Pushing
+        grids one by one gives the same tracks as get_tracks. """
+        if self.record is None:
+            self.__start(get_grid_size(grid_obj), get_radar_info(grid_obj))
+        tracing = self.__start_tracing()
+        scan2 = get_scan_products(grid_obj, self.field, self.grid_size,
+                                  self.params, self.fft_engine)
+        new_rows = self.push_scan(scan2)
+        scan2['grid'] = None
+        if tracing:
+            stop_tracing()
+        return new_rows
+
+    def push_scan(self, scan2):
+        """ Same as push, given the products of the new scan rather than its
+        grid. See get_scan_products in tint.helpers. As for track_scans, the
+        first scan of a new tracks object must hold the grid_size and
+        radar_info of its grid. """
+        if self.record is None:
+            self.__start(scan2['grid_size'], scan2['radar_info'])
+        if self.last_scan is not None:
+            self.__drop_scans(self.record.scan + 1)
+
+        tracing = self.__start_tracing()
+        self.grids_read += 1
+        written = []
+        if self.last_scan is not None:
+            written.append(self.__link_scans(self.last_scan, scan2))
+        self.__save()
+        self.last_scan = scan2
+        written.append(self.__link_scans(scan2, get_empty_products(scan2)))
+        self.__load()
+        if tracing:
+            stop_tracing()
+
+        new_rows = TracksBuffer()
+        for columns in written:
+            if columns is not None:
+                new_rows.append(columns)
+        return new_rows.to_frame()
+
+    def stitch(self, chunk):
+        """ Appends the tracks of a later chunk of scans tracked by another
+        Cell_tracks object, see track_chunk in tint.chunks. The last scan of
+        this object is linked to the first scan of the chunk with get_pairs,
+        and the uids of the chunk are rewritten to continue those of this
+        object, so uids stay unique. This object then continues from the last
+        scan of the chunk. The tracks of the chunk are only those of a single
+        run if its objects and interval at the link to its first scan are
+        those of this object. Otherwise only the first scan is added and
+        False is returned, so that the following scans can be tracked by
+        this object with get_tracks. Returns True if the chunk was added. """
+        chunk_obj = chunk['tracks_obj']
+        offset = chunk['offset']
+        start = chunk['start']
+        if start != self.record.scan + 2:
+            raise ValueError('chunk does not start after the last scan')
+
+        # link the last scan of this object to the first scan of the chunk
+        self.push_scan(restore_products(chunk['first_scan'], self.fft_engine))
+        if chunk_obj.record.scan + 1 == start - offset:
+            # the chunk holds only its first scan, which is now linked
+            return True
+        if (chunk['interval'] != self.record.interval
+                or not same_objects(chunk['current_objects'],
+                                    self.current_objects)):
+            return False
+
+        columns = chunk_obj.tracks_buffer.get_columns()
+        if chunk_obj.tracks_buffer.nrows == 0:
+            columns = {'scan': np.array([], dtype=int),
+                       'uid': np.array([], dtype=object)}
+        keep = columns['scan'] >= start - offset
+        first_uids = columns['uid'][columns['scan'] == start - offset]
+        uid_map = {}
+        if self.current_objects is not None:
+            for obj, uid in enumerate(first_uids):
+                linked = self.current_objects['id2'] == obj + 1
+                if linked.any():
+                    uid_map[uid] = self.current_objects['uid'][linked][0]
+        # other cells get new uids in order of birth
+        chunk_uids, first_index = np.unique(columns['uid'][keep],
+                                            return_index=True)
+        first_scans = columns['scan'][keep][first_index]
+        nlast = 0
+        for obj in np.argsort(first_index):
+            if chunk_uids[obj] not in uid_map:
+                uid_map[chunk_uids[obj]] = self.counter.next_uid()[0]
+                nlast += first_scans[obj] == chunk_obj.record.scan + 1
+        # like counter of the chunk, leave out cells born in the last scan,
+        # which are numbered again when the last scan is overwritten
+        self.counter.uid -= nlast
+
+        self.__drop_scans(start)
+        if keep.any():
+            chunk_columns = dict((name, column[keep])
+                                 for name, column in columns.items())
+            chunk_columns['scan'] = chunk_columns['scan'] + offset
+            chunk_columns['uid'] = np.array(
+                [uid_map[uid] for uid in chunk_columns['uid']], dtype=object)
+            self.tracks_buffer.append(chunk_columns)
+        if self.metrics is not None and chunk_obj.metrics is not None:
+            metrics = chunk_obj.metrics.get_columns()
+            for index in np.flatnonzero(metrics['scan'] >= start - offset):
+                row = dict((name, column[index])
+                           for name, column in metrics.items())
+                row['scan'] += offset
+                self.metrics.add(row)
+
+        record = chunk_obj.record
+        shift_rows = record.shift_rows[:record.nshifts]
+        shift_rows = shift_rows[shift_rows['scan'] >= start - offset].copy()
+        shift_rows['scan'] += offset
+        shift_rows['uid'] = [uid_map[uid] for uid in shift_rows['uid']]
+        nshifts = self.record.nshifts + len(shift_rows)
+        record.shift_rows = grow_rows(self.record.shift_rows, nshifts)
+        record.shift_rows[self.record.nshifts:nshifts] = shift_rows
+        record.nshifts = nshifts
+        # cases tallied by the chunk before its first scan are not counted
+        for case in record.correction_tally:
+            record.correction_tally[case] += (
+                self.record.correction_tally[case] - chunk['tally'][case])
+        record.candidate_tally += (self.record.candidate_tally
+                                   - chunk['candidates'])
+        record.scan += offset
+
+        current_objects = chunk_obj.current_objects
+        if current_objects is not None:
+            current_objects = dict(current_objects)
+            current_objects['uid'] = np.array(
+                [uid_map[uid] for uid in current_objects['uid']])
+        self.record = record
+        self.current_objects = current_objects
+        self.last_scan = chunk_obj.last_scan
+        self.grids_read = offset + chunk_obj.grids_read
+        return True